@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+HTTP/JSON API for LLM-library Chat Test
+An ASGI app for batch jobs and internal tools that need the chat service
+without a browser: POST /chat (server-sent events when streaming),
+GET /models and GET /history, plus /auth/register and /auth/login for
+bearer tokens. Accounts, persistence and the request engine are the same
+ChatService the Streamlit page runs on. Waiting for tokens holds no
+thread, so one process can keep thousands of streams open; the engine's
+concurrency and rate limits decide how many generate at once.
+
+Usage: uvicorn api_server:app --port 8600   (or: python api_server.py --port 8600)
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import base64
+import hashlib
+import argparse
+import contextlib
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from chat_service import HISTORY_PAGE_SIZE, ChatService
+from request_engine import EngineBusyError
+
+# Key for signing bearer tokens. Set it when running several workers or to keep
+# tokens valid across restarts; otherwise each process signs with a random key.
+API_TOKEN_SECRET = os.getenv("API_TOKEN_SECRET", "")
+# Seconds a bearer token stays valid
+API_TOKEN_TTL = int(os.getenv("API_TOKEN_TTL", "86400"))
+
+# Largest history page a client may ask for
+MAX_HISTORY_PAGE_SIZE = 50
+
+_AUTH_FAILURES = {"User not found", "Invalid password"}
+
+
+class TokenSigner:
+    """Stateless bearer tokens: base64('email|expiry|hmac'), verifiable by any worker sharing the key"""
+
+    def __init__(self, secret=API_TOKEN_SECRET, ttl=API_TOKEN_TTL):
+        self.key = secret.encode() if secret else os.urandom(32)
+        self.ttl = ttl
+
+    def _signature(self, payload):
+        return hmac.new(self.key, payload.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, email):
+        """Return (token, expiry timestamp) for a signed-in user"""
+        expires_at = int(time.time()) + self.ttl
+        payload = f"{email}|{expires_at}"
+        token = base64.urlsafe_b64encode(f"{payload}|{self._signature(payload)}".encode()).decode()
+        return token, expires_at
+
+    def verify(self, token):
+        """Email the token was issued to, or None if it is forged, malformed or expired"""
+        try:
+            payload, _, signature = base64.urlsafe_b64decode(token.encode()).decode().rpartition("|")
+            email, _, expires_at = payload.rpartition("|")
+            if not hmac.compare_digest(signature, self._signature(payload)) or int(expires_at) < time.time():
+                return None
+        except ValueError:
+            return None
+        return email or None
+
+
+def error(status, message):
+    """JSON error response"""
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def sse_event(event, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def read_json(request):
+    """Request body as a JSON object, or None"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def valid_history(history):
+    """Whether a client-supplied history is a list of user/assistant text messages"""
+    return isinstance(history, list) and all(
+        isinstance(message, dict)
+        and message.get("role") in ("user", "assistant")
+        and isinstance(message.get("content"), str)
+        for message in history
+    )
+
+
+def create_app(service=None, signer=None):
+    """Build the ASGI app around a ChatService (a default one is created lazily)"""
+    service = service or ChatService()
+    signer = signer or TokenSigner()
+
+    async def signed_in_email(request):
+        """Email behind a valid bearer token, or None"""
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        email = signer.verify(token.strip())
+        # A deleted account's unexpired token stops working
+        if email and await run_in_threadpool(service.users.exists, email):
+            return email
+        return None
+
+    async def register(request):
+        body = await read_json(request)
+        if body is None:
+            return error(400, "Expected a JSON object")
+        email, password = str(body.get("email", "")), str(body.get("password", ""))
+        if "@" not in email:
+            return error(400, "Please enter a valid email")
+        if len(password) < 6:
+            return error(400, "Password must be at least 6 characters")
+        ok, message = await run_in_threadpool(service.register, email, password)
+        if not ok:
+            return error(409 if message == "User already exists" else 503, message)
+        return JSONResponse({"email": email, "message": message}, status_code=201)
+
+    async def login(request):
+        body = await read_json(request)
+        if body is None:
+            return error(400, "Expected a JSON object")
+        email, password = str(body.get("email", "")), str(body.get("password", ""))
+        ok, message = await run_in_threadpool(service.authenticate, email, password)
+        if not ok:
+            # Anything but bad credentials is the hashing pool turning the request away
+            return error(401 if message in _AUTH_FAILURES else 503, message)
+        token, expires_at = signer.issue(email)
+        return JSONResponse({"token": token, "expires_at": expires_at})
+
+    async def models(request):
+        # Served from the catalog the health monitor keeps fresh; only a cold start may wait
+        catalog = await run_in_threadpool(service.catalog)
+        return JSONResponse({
+            "source": service.catalog_store.source,
+            "data": [catalog.models[model_id] for model_id in catalog.ids]
+        })
+
+    async def chat(request):
+        body = await read_json(request)
+        if body is None:
+            return error(400, "Expected a JSON object")
+        prompt, model = body.get("prompt"), body.get("model")
+        history = body.get("history", [])
+        if not isinstance(prompt, str) or not prompt.strip():
+            return error(400, "'prompt' must be a non-empty string")
+        if not isinstance(model, str) or not model:
+            return error(400, "'model' is required")
+        if not valid_history(history):
+            return error(400, "'history' must be a list of {role: user|assistant, content} messages")
+
+        # Signed-in turns are saved to the user's history; anonymous ones are not
+        email = await signed_in_email(request)
+        # Each user (or client address) is its own queue in the engine's round-robin
+        session_id = email or f"api:{request.client.host if request.client else 'unknown'}"
+
+        if not body.get("stream", True):
+            try:
+                reply = await service.asend(session_id, prompt, model, history, email=email)
+            except EngineBusyError as e:
+                return error(503, str(e))
+            except Exception as e:
+                return error(502, str(e))
+            return JSONResponse(reply.to_dict())
+
+        try:
+            reply = await service.astream(session_id, prompt, model, history, email=email)
+        except Exception as e:
+            return error(502, str(e))
+
+        async def events():
+            try:
+                async for delta in reply:
+                    yield sse_event("delta", {"text": delta})
+            except Exception as e:
+                yield sse_event("error", {"error": str(e)})
+                return
+            summary = reply.to_dict()
+            # The client already has the text from the deltas
+            summary.pop("content")
+            yield sse_event("done", summary)
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    async def history(request):
+        email = await signed_in_email(request)
+        if email is None:
+            return error(401, "A bearer token from /auth/login is required")
+        try:
+            before = int(request.query_params["before"]) if "before" in request.query_params else None
+            page_size = int(request.query_params.get("page_size", HISTORY_PAGE_SIZE))
+        except ValueError:
+            return error(400, "'before' and 'page_size' must be integers")
+        page_size = max(1, min(page_size, MAX_HISTORY_PAGE_SIZE))
+        entries, next_cursor = await run_in_threadpool(service.history_page, email, before, page_size)
+        return JSONResponse({"entries": entries, "next_cursor": next_cursor})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        service.start_maintenance()
+        yield
+        service.close()
+
+    return Starlette(
+        routes=[
+            Route("/auth/register", register, methods=["POST"]),
+            Route("/auth/login", login, methods=["POST"]),
+            Route("/models", models, methods=["GET"]),
+            Route("/chat", chat, methods=["POST"]),
+            Route("/history", history, methods=["GET"]),
+        ],
+        lifespan=lifespan
+    )
+
+
+# Nothing is opened or started until the first request (or the lifespan startup)
+app = create_app()
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the chat API over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=1, help="Server processes (set API_TOKEN_SECRET when > 1)")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and not API_TOKEN_SECRET:
+        print("⚠️  WARNING: API_TOKEN_SECRET is not set; tokens only work on the worker that issued them")
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,17 @@
 import streamlit as st
-import json
-import hashlib
-import datetime
 import os
-import requests
 import random
 import string
-from groq import Groq
+import time
+import statistics
+from collections import deque
+from streamlit.errors import StreamlitAPIException
+from chat_service import FALLBACK_MODELS, HEALTH_CHECK_INTERVAL, PLACEHOLDER_API_KEY, ChatService
+# Re-exported for scripts and tests that use the app module's helpers
+from guest_sessions import generate_guest_id
+from passwords import hash_password
+from rendering import render_assistant_output
+from telemetry import get_telemetry
 
 # Optional dotenv import for local development
 try:
@@ -33,221 +38,140 @@ def get_api_key():
         pass
     
     # 3. Demo fallback (with warning) - REPLACE WITH YOUR KEY
-    return "gsk_YOUR_API_KEY_HERE_REPLACE_THIS_PLACEHOLDER"
+    print("⚠️  WARNING: Using placeholder API key. Set GROQ_API_KEY environment variable for production!")
+    return PLACEHOLDER_API_KEY
 
-GROQ_API_KEY = get_api_key()
+# Most models a single prompt can be compared across
+MAX_COMPARE_MODELS = 4
 
-# Warn if using demo key
-if GROQ_API_KEY == "gsk_YOUR_API_KEY_HERE_REPLACE_THIS_PLACEHOLDER":
-    print("⚠️  WARNING: Using placeholder API key. Set GROQ_API_KEY environment variable for production!")
+# Minimum seconds between partial re-renders while streaming a response
+STREAM_RENDER_INTERVAL = 0.05
+
+# Seconds between sidebar history refreshes (0 refreshes only on sidebar actions and full reruns)
+HISTORY_REFRESH_INTERVAL = float(os.getenv("HISTORY_REFRESH_INTERVAL", "10")) or None
 
-client = Groq(api_key=GROQ_API_KEY)
+# Recent render durations kept per page section for the rerun timing readout
+RERUN_TIMING_SAMPLES = 50
+
+@st.cache_resource
+def get_chat_service():
+    """Process-wide chat service; its clients, stores and background threads start on first use"""
+    return ChatService(api_key=get_api_key())
 
 # Function to fetch available models from Groq API
 def get_groq_models():
-    """Fetch available models from Groq API"""
-    try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        response = requests.get("https://api.groq.com/openai/v1/models", headers=headers)
-        if response.status_code == 200:
-            models_data = response.json()
-            # Filter for text generation models and create a clean dictionary
-            groq_models = {}
-            for model in models_data.get("data", []):
-                model_id = model.get("id", "")
-                # Filter out non-text generation models (whisper, etc.)
-                if not any(skip in model_id.lower() for skip in ["whisper", "distil"]):
-                    # Create a clean display name
-                    display_name = model_id.replace("-", " ").title()
-                    groq_models[model_id] = display_name
-            return groq_models
-        else:
-            # Fallback to static list if API fails
-            return get_fallback_models()
-    except Exception as e:
-        # Fallback to static list if API fails
-        return get_fallback_models()
+    """Fetch available models from Groq API as {id: display name}"""
+    return get_chat_service().models()
 
 def get_fallback_models():
     """Fallback model list if API fails"""
-    return {
-        "llama-3.1-70b-versatile": "Llama 3.1 70B Versatile",
-        "llama-3.1-8b-instant": "Llama 3.1 8B Instant", 
-        "llama-3.2-11b-text-preview": "Llama 3.2 11B Text",
-        "llama-3.2-3b-preview": "Llama 3.2 3B Preview",
-        "llama-3.2-1b-preview": "Llama 3.2 1B Preview",
-        "llama3-groq-70b-8192-tool-use-preview": "Llama 3 Groq 70B Tool Use",
-        "llama3-groq-8b-8192-tool-use-preview": "Llama 3 Groq 8B Tool Use",
-        "llama3-70b-8192": "Llama 3 70B",
-        "llama3-8b-8192": "Llama 3 8B",
-        "mixtral-8x7b-32768": "Mixtral 8x7B",
-        "gemma2-9b-it": "Gemma 2 9B IT",
-        "gemma-7b-it": "Gemma 7B IT"
-    }
+    return dict(FALLBACK_MODELS)
 
 # Function to test API connection and get status
 def test_groq_api():
     """Test if Groq API is working and return status info"""
-    try:
-        # Test with model list endpoint first
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        response = requests.get("https://api.groq.com/openai/v1/models", headers=headers, timeout=5)
-        if response.status_code == 200:
-            models_count = len(response.json().get("data", []))
-            return True, f"API Connected - {models_count} models available"
-        else:
-            return False, f"API Error: {response.status_code}"
-    except Exception as e:
-        return False, f"Connection Error: {str(e)[:50]}"
-
-def format_thinking_tags(text):
-    """Format text between <think> and </think> tags in italic with a note"""
-    import re
-    
-    def replace_thinking(match):
-        thinking_content = match.group(1).strip()
-        return f'<em>{thinking_content}</em> <em>(Model\'s thoughts)</em>'
-    
-    # Replace <think>content</think> with HTML italic formatting and note
-    formatted_text = re.sub(r'<think>(.*?)</think>', replace_thinking, text, flags=re.DOTALL)
-    return formatted_text
-
-# Function to generate random guest ID
-def generate_guest_id():
-    """Generate a random guest ID"""
-    return "Guest_" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-
-# Get models on app start - cache to avoid repeated API calls
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def get_cached_groq_models():
-    """Cached version of get_groq_models to reduce memory usage"""
-    return get_groq_models()
+    return get_chat_service().api_status()
 
 # Authentication functions
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def load_user_data():
-    """Load user data from JSON file with caching"""
-    if os.path.exists("users.json"):
-        with open("users.json", "r") as f:
-            return json.load(f)
-    return {}
+    """Load a snapshot of every user record with caching (bulk/admin use only)"""
+    return get_chat_service().load_users()
 
 def save_user_data(data):
-    """Save user data to JSON file and clear cache"""
-    with open("users.json", "w") as f:
-        json.dump(data, f, indent=2)
-    # Clear the cache when data is updated
-    load_user_data.clear()
-
-def hash_password(password):
-    """Hash password using SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Replace the stored user records with 'data' in one transaction"""
+    get_chat_service().save_users(data)
 
 def authenticate_user(email, password):
     """Authenticate user credentials"""
-    users = load_user_data()
-    if email in users:
-        if users[email]["password"] == hash_password(password):
-            return True, "Login successful!"
-        else:
-            return False, "Invalid password"
-    return False, "User not found"
+    return get_chat_service().authenticate(email, password)
 
 def register_user(email, password, is_guest=False):
     """Register new user or guest"""
-    users = load_user_data()
-    if email in users and not is_guest:
-        return False, "User already exists"
-    
-    users[email] = {
-        "password": hash_password(password) if password else "",
-        "created_at": datetime.datetime.now().isoformat(),
-        "chat_history": [],
-        "is_guest": is_guest,
-        "guest_session_id": st.session_state.get("session_id", "") if is_guest else ""
-    }
-    save_user_data(users)
-    return True, "Registration successful!" if not is_guest else "Guest session created!"
+    guest_session_id = st.session_state.get("session_id", "") if is_guest else ""
+    return get_chat_service().register(email, password, is_guest=is_guest, guest_session_id=guest_session_id)
 
 def create_guest_user():
     """Create a temporary guest user"""
-    guest_id = generate_guest_id()
     # Generate a session ID to track the guest
     if "session_id" not in st.session_state:
         st.session_state.session_id = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
     
-    success, message = register_user(guest_id, "", is_guest=True)
-    if success:
-        st.session_state.authenticated = True
-        st.session_state.user_email = guest_id
-        st.session_state.guest_mode = True
-        st.session_state.chat_history = []
+    # Guests live in memory only; nothing is written until they sign in
+    guest_id = get_chat_service().start_guest(st.session_state.session_id)
+    st.session_state.authenticated = True
+    st.session_state.user_email = guest_id
+    st.session_state.guest_mode = True
+    st.session_state.chat_history = []
     return guest_id
 
-def cleanup_guest_users():
-    """Remove guest users from storage - optimized to run less frequently"""
-    # Only cleanup every 10th session to reduce overhead
-    if "cleanup_counter" not in st.session_state:
-        st.session_state.cleanup_counter = 0
-    
-    st.session_state.cleanup_counter += 1
-    if st.session_state.cleanup_counter % 10 != 0:
-        return  # Skip cleanup most of the time
-    
-    users = load_user_data()
-    current_session_id = st.session_state.get("session_id", "")
-    
-    # Keep only non-guest users and current session guest
-    cleaned_users = {}
-    for email, user_data in users.items():
-        if not user_data.get("is_guest", False):
-            # Keep regular users
-            cleaned_users[email] = user_data
-        elif user_data.get("guest_session_id") == current_session_id:
-            # Keep current session guest
-            cleaned_users[email] = user_data
-    
-    # Only save if there's actually a difference to reduce I/O
-    if len(cleaned_users) != len(users):
-        save_user_data(cleaned_users)
-
-def save_user_prompt(email, prompt, response, model):
-    """Save user prompt and response to history"""
-    users = load_user_data()
-    if email in users:
-        users[email]["chat_history"].append({
-            "timestamp": datetime.datetime.now().isoformat(),
-            "prompt": prompt,
-            "response": response,
-            "model": model
-        })
-        save_user_data(users)
-
-def get_user_history(email, limit=10):
-    """Get user chat history with memory optimization"""
-    users = load_user_data()
-    if email in users:
-        # Only return the last 'limit' entries to save memory
-        history = users[email]["chat_history"]
-        return history[-limit:] if len(history) > limit else history
-    return []
-
-# Streamlit configuration
-st.set_page_config(
-    page_title="LLM-library Chat Test",
-    page_icon="🤖",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+def signed_in_email():
+    """Email (or guest ID) whose history this session's chats are saved to, if any"""
+    if st.session_state.authenticated and st.session_state.user_email:
+        return st.session_state.user_email
+    return None
+
+def stream_assistant_response(reply, placeholder, span):
+    """Render a streaming reply into a Streamlit placeholder as it arrives and return the full text"""
+    buffer = ""
+    last_render = 0.0
+    render_seconds = 0.0
+    for delta in reply:
+        buffer += delta
+        # Throttle re-renders so fast token streams don't flood the websocket
+        now = time.monotonic()
+        if now - last_render >= STREAM_RENDER_INTERVAL:
+            placeholder.markdown(render_assistant_output(buffer, streaming=True), unsafe_allow_html=True)
+            last_render = now
+            render_seconds += time.monotonic() - now
+    
+    render_start = time.monotonic()
+    placeholder.markdown(render_assistant_output(buffer), unsafe_allow_html=True)
+    span.phase("render", render_seconds + time.monotonic() - render_start)
+    return buffer
+
+def render_comparison_result(placeholder, result):
+    """Render one model's reply, latency and token counts into its compare column"""
+    with placeholder.container():
+        if result.get("error"):
+            st.error(f"Error: {result['error']}")
+            return
+        st.markdown(render_assistant_output(result["content"]), unsafe_allow_html=True)
+        if result["cached"]:
+            st.caption("⚡ Cached response")
+        else:
+            usage = result["usage"]
+            tokens = f" · {usage.total_tokens} tokens ({usage.prompt_tokens} in / {usage.completion_tokens} out)" if usage else ""
+            st.caption(f"⏱️ {result['latency']:.2f} s{tokens}")
+
+def compare_models(prompt, models):
+    """Send one prompt to several models in parallel, rendering each reply as it completes"""
+    placeholders = {}
+    for column, model_id in zip(st.columns(len(models)), models):
+        with column:
+            st.markdown(f"**{model_id}**")
+            placeholders[model_id] = st.empty()
+            placeholders[model_id].info("⏳ Waiting for response...")
+    
+    results = {}
+    for result in get_chat_service().compare(st.session_state.session_id, prompt, models, email=signed_in_email()):
+        results[result["model"]] = result
+        render_comparison_result(placeholders[result["model"]], result)
+    return [results[model_id] for model_id in models]
+
+def record_rerun_time(section, seconds):
+    """Keep this session's recent render durations for a page section"""
+    timings = st.session_state.setdefault("rerun_timings", {})
+    timings.setdefault(section, deque(maxlen=RERUN_TIMING_SAMPLES)).append(seconds)
+
+def rerun_fragment():
+    """Rerun only the calling fragment, or the whole page if it is running as part of a full rerun"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
 # Dark theme CSS styling - optimized for memory with config.toml colors
-st.markdown("""
+PAGE_CSS = """
     <style>
     /* Base theme colors matching removed config.toml */
     :root {
@@ -384,144 +308,221 @@ st.markdown("""
         color: var(--text-color) !important;
     }
     </style>
-    """, unsafe_allow_html=True)
-
-# Initialize session state with memory optimization
-if "authenticated" not in st.session_state:
-    st.session_state.authenticated = False
-if "user_email" not in st.session_state:
-    st.session_state.user_email = ""
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "show_login" not in st.session_state:
-    st.session_state.show_login = False
-if "guest_mode" not in st.session_state:
-    st.session_state.guest_mode = True
-    # Only create guest user if not already authenticated
-    if not st.session_state.authenticated:
-        guest_id = create_guest_user()
-
-# Clean up guest users less frequently to reduce overhead
-cleanup_guest_users()
-
-# Main page title
-st.markdown("""
-    <div class="main-title">
-        LLM-library Chat Test
-    </div>
-    """, unsafe_allow_html=True)
-
-# Model selection - available to all users
-# Get sorted list of model IDs (original names), filtered to exclude certain models
-groq_models = get_cached_groq_models()
-all_models = list(groq_models.keys())
-filtered_models = [model for model in all_models 
-                  if not model.startswith('allam') and not model.startswith('playai')]
-available_models = sorted(filtered_models)
-
-# Initialize default selection if not in session state
-if 'selected_model' not in st.session_state:
-    st.session_state.selected_model = available_models[0]
-
-# Find current index
-current_index = 0
-if st.session_state.selected_model in available_models:
-    current_index = available_models.index(st.session_state.selected_model)
-
-selected_model = st.selectbox(
-    "Choose a model",
-    options=available_models,
-    index=current_index,
-    help="Choose from our available Groq models for text generation",
-    key="model_selector"
-)
-
-# Update session state
-st.session_state.selected_model = selected_model
-model = selected_model
-
-# Chat interface
-st.markdown("### Chat")
-
-# User input
-user_input = st.text_area(
-    "Enter your message:",
-    height=100,
-    placeholder="Type your message here..."
-)
-
-# Send and Clear buttons
-col1, col2 = st.columns([3, 1])
-with col1:
-    send_button = st.button("Send", type="primary", use_container_width=True)
-with col2:
-    clear_button = st.button("🗑️ Clear", use_container_width=True)
-
-if clear_button:
-    st.session_state.chat_history = []
-    st.rerun()
-
-if send_button:
-    if user_input.strip():
-        try:
-            # Add user message to chat history
-            st.session_state.chat_history.append({"role": "user", "content": user_input})
-            
-            # Prepare messages with gentle response length guidance
-            system_prompt = {
-                "role": "system", 
-                "content": "Please provide helpful and informative responses. Try to keep your answers reasonably concise when possible, but feel free to elaborate when needed to fully address the question."
-            }
-            
-            # Combine system prompt with chat history
-            messages_for_api = [system_prompt] + st.session_state.chat_history
-            
-            # Get response from Groq
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages_for_api,
-                temperature=0.7
-            )
-            
-            assistant_response = response.choices[0].message.content
-            
-            # Add assistant response to chat history
-            st.session_state.chat_history.append({"role": "assistant", "content": assistant_response})
-            
-            # Save to user history for all authenticated users (including guests)
-            if st.session_state.authenticated and st.session_state.user_email:
-                save_user_prompt(st.session_state.user_email, user_input, assistant_response, model)
-            
-            st.rerun()
-            
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-
-# Display only the latest conversation
-if st.session_state.chat_history:
-    # Find the last user message and assistant response
-    messages = st.session_state.chat_history
-    if len(messages) >= 2:
-        last_user = messages[-2] if messages[-2]["role"] == "user" else None
-        last_assistant = messages[-1] if messages[-1]["role"] == "assistant" else None
-        
-        if last_user and last_assistant:
+    """
+
+@st.fragment
+def chat_panel():
+    """Model choice, input and the latest reply; chat actions rerun only this fragment"""
+    started = time.perf_counter()
+    # Model selection - available to all users
+    # The catalog is already filtered (MODEL_INCLUDE/MODEL_EXCLUDE) and sorted by model ID
+    service = get_chat_service()
+    catalog = service.catalog()
+    available_models = catalog.ids
+
+    # Initialize default selection if not in session state
+    if 'selected_model' not in st.session_state:
+        st.session_state.selected_model = available_models[0]
+
+    selected_model = st.selectbox(
+        "Choose a model",
+        options=available_models,
+        index=catalog.index_of(st.session_state.selected_model),
+        help="Choose from our available Groq models for text generation",
+        key="model_selector"
+    )
+
+    # Update session state
+    st.session_state.selected_model = selected_model
+    model = selected_model
+
+    stream_responses = st.toggle(
+        "Stream responses",
+        value=True,
+        help="Show the reply token by token as it is generated",
+        key="stream_responses"
+    )
+
+    compare_mode = st.toggle(
+        "Compare models",
+        value=False,
+        help="Send the same prompt to several models in parallel and show the replies side by side",
+        key="compare_mode"
+    )
+    if compare_mode:
+        compare_selection = st.multiselect(
+            "Models to compare",
+            options=available_models,
+            default=[selected_model],
+            max_selections=MAX_COMPARE_MODELS,
+            key="compare_models"
+        )
+
+    # Chat interface
+    st.markdown("### Chat")
+
+    # User input
+    user_input = st.text_area(
+        "Enter your message:",
+        height=100,
+        placeholder="Type your message here..."
+    )
+
+    # Send and Clear buttons
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        send_button = st.button("Send", type="primary", use_container_width=True)
+    with col2:
+        clear_button = st.button("🗑️ Clear", use_container_width=True)
+
+    if clear_button:
+        st.session_state.chat_history = []
+        st.session_state.context_report = None
+        st.session_state.compare_results = None
+        rerun_fragment()
+
+    compare_rendered = False
+    if send_button and compare_mode:
+        if not user_input.strip():
+            pass
+        elif not compare_selection:
+            st.error("Select at least one model to compare")
+        else:
+            st.session_state.compare_results = compare_models(user_input, compare_selection)
+            st.session_state.compare_prompt = user_input
+            compare_rendered = True
+    elif send_button:
+        if user_input.strip():
+            # One span per turn, broken down into context, cache, queue, API, render and persist phases
+            turn = get_telemetry().span("chat.turn", model=model, stream=stream_responses)
+            try:
+                # The service trims context, checks the cache, calls the model (failing over
+                # if it must) and saves the turn for all signed-in users, including guests
+                if stream_responses:
+                    reply = service.stream(
+                        st.session_state.session_id,
+                        user_input,
+                        model,
+                        history=st.session_state.chat_history,
+                        email=signed_in_email(),
+                        span=turn
+                    )
+                    if reply.cached:
+                        reply.wait()
+                    else:
+                        # Render tokens as they arrive; the full text is persisted once the stream ends
+                        with st.chat_message("user"):
+                            st.write(user_input)
+                        with st.chat_message("assistant"):
+                            stream_assistant_response(reply, st.empty(), turn)
+                else:
+                    reply = service.send(
+                        st.session_state.session_id,
+                        user_input,
+                        model,
+                        history=st.session_state.chat_history,
+                        email=signed_in_email(),
+                        span=turn
+                    )
+                turn.finish()
+                
+                # History only gains the prompt once it has an answer, so turns keep alternating
+                st.session_state.chat_history.append({"role": "user", "content": user_input})
+                st.session_state.chat_history.append({
+                    "role": "assistant",
+                    "content": reply.content,
+                    "cached": reply.cached,
+                    "model": reply.model,
+                    "requested_model": reply.requested_model
+                })
+                st.session_state.context_report = reply.context_report
+                
+                # Redraw only this panel; the sidebar history picks the turn up on its refresh
+                rerun_fragment()
+                
+            except Exception as e:
+                turn.fail(e)
+                turn.finish()
+                st.error(f"Error: {str(e)}")
+
+    # Display the latest comparison when in compare mode
+    if compare_mode:
+        if not compare_rendered and st.session_state.get("compare_results"):
             with st.chat_message("user"):
-                st.write(last_user["content"])
-            with st.chat_message("assistant"):
-                # Format the assistant response to handle <think> tags
-                formatted_response = format_thinking_tags(last_assistant["content"])
-                st.markdown(formatted_response, unsafe_allow_html=True)
-
-# Sidebar for authentication and chat history
-with st.sidebar:
-    # API Status indicator with detailed info
-    api_working, api_status = test_groq_api()
-    if api_working:
-        st.success(f"🟢 {api_status}")
+                st.write(st.session_state.compare_prompt)
+            results = st.session_state.compare_results
+            for column, result in zip(st.columns(len(results)), results):
+                with column:
+                    st.markdown(f"**{result['model']}**")
+                    render_comparison_result(st.empty(), result)
+    # Display only the latest conversation
+    elif st.session_state.chat_history:
+        # Find the last user message and assistant response
+        messages = st.session_state.chat_history
+        if len(messages) >= 2:
+            last_user = messages[-2] if messages[-2]["role"] == "user" else None
+            last_assistant = messages[-1] if messages[-1]["role"] == "assistant" else None
+            
+            if last_user and last_assistant:
+                with st.chat_message("user"):
+                    st.write(last_user["content"])
+                with st.chat_message("assistant"):
+                    # Collapsible <think> blocks, escaped HTML, code fences kept verbatim
+                    st.markdown(render_assistant_output(last_assistant["content"]), unsafe_allow_html=True)
+                    if last_assistant.get("cached"):
+                        st.caption("⚡ Cached response - this conversation was answered recently by the same model")
+                    elif last_assistant.get("model") != last_assistant.get("requested_model", last_assistant.get("model")):
+                        st.caption(
+                            f"↪️ Answered by {last_assistant['model']} because "
+                            f"{last_assistant['requested_model']} was unavailable"
+                        )
+                
+                # Let the user know when older turns were left out of the prompt
+                context_report = st.session_state.get("context_report")
+                if context_report and context_report["trimmed_messages"]:
+                    st.caption(
+                        f"✂️ Context trimmed: {context_report['trimmed_messages']} earlier messages "
+                        f"(~{context_report['trimmed_tokens']:,} tokens) were not sent to the model"
+                    )
+    record_rerun_time("chat_panel", time.perf_counter() - started)
+
+@st.fragment(run_every=HEALTH_CHECK_INTERVAL)
+def status_panel():
+    """API status from the background monitor, redrawn on its own schedule"""
+    # API Status indicator - last result from the background monitor, never blocks
+    service = get_chat_service()
+    api_health = service.health_monitor.status()
+    if not api_health["checked"]:
+        st.info(f"⏳ {api_health['message']}")
+    elif api_health["ok"]:
+        st.success(f"🟢 {api_health['message']}")
     else:
-        st.error(f"🔴 {api_status}")
+        st.error(f"🔴 {api_health['message']}")
+    if api_health["checked"]:
+        st.caption(f"Checked {api_health['age']:.0f}s ago · {api_health['latency'] * 1000:.0f} ms")
+    catalog_status = service.catalog_store.status()
+    if catalog_status["source"] != "live":
+        saved = f" saved {catalog_status['updated_at'][:16].replace('T', ' ')}" if catalog_status["updated_at"] else ""
+        st.caption(f"📦 Showing the last known model list ({catalog_status['source']}{saved})")
     
+    # Turn latency percentiles for the selected model across every session in this process
+    turn_latency = get_telemetry().quantiles("chat.turn").get(st.session_state.get("selected_model"))
+    if turn_latency:
+        st.caption(
+            f"📈 Turns on {st.session_state.selected_model}: p50 {turn_latency['p50']:.2f} s · "
+            f"p95 {turn_latency['p95']:.2f} s ({turn_latency['count']} turns)"
+        )
+    
+    # How much work a chat action skips now that it reruns only the chat panel
+    timings = st.session_state.get("rerun_timings", {})
+    if timings.get("app") and timings.get("chat_panel"):
+        app_ms = statistics.median(timings["app"]) * 1000
+        chat_ms = statistics.median(timings["chat_panel"]) * 1000
+        st.caption(f"⏱️ Rerun: full page {app_ms:.0f} ms · chat panel {chat_ms:.0f} ms (~{app_ms - chat_ms:.0f} ms saved per chat action)")
+
+@st.fragment
+def auth_panel():
+    """Sign-in, registration and sign-out"""
     # Authentication section
     st.markdown("### 🔐 Authentication")
     
@@ -530,27 +531,27 @@ with st.sidebar:
         st.info(f"👤 Logged in as: {st.session_state.user_email}")
         if st.button("Sign In with Email", key="sidebar_signin", use_container_width=True):
             st.session_state.show_login = True
-            st.rerun()
+            rerun_fragment()
     elif st.session_state.show_login:
         # Login form
         st.markdown("#### Login")
         login_email = st.text_input("Email", key="login_email")
         login_password = st.text_input("Password", type="password", key="login_password")
-        
+    
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Login", key="login_btn"):
                 if login_email and login_password:
-                    success, message = authenticate_user(login_email, login_password)
+                    # Carries this session's guest chats over to the account, then drops the guest
+                    guest_id = st.session_state.user_email if st.session_state.guest_mode else None
+                    success, message = get_chat_service().sign_in(login_email, login_password, guest_id=guest_id)
                     if success:
-                        # Clean up guest user before switching
-                        cleanup_guest_users()
                         st.session_state.authenticated = True
                         st.session_state.user_email = login_email
                         st.session_state.guest_mode = False
                         st.session_state.show_login = False
                         # Load user's chat history (limit to last 5 to save memory)
-                        user_history = get_user_history(login_email, limit=5)
+                        user_history = get_chat_service().history(login_email, limit=5)
                         if user_history:
                             # Convert user history to chat format
                             st.session_state.chat_history = []
@@ -560,18 +561,18 @@ with st.sidebar:
                         st.rerun()
                     else:
                         st.error(message)
-        
+    
         with col2:
             if st.button("Cancel", key="cancel_login"):
                 st.session_state.show_login = False
-                st.rerun()
-        
+                rerun_fragment()
+    
         # Register form
         st.markdown("#### Register")
         reg_email = st.text_input("Email", key="reg_email")
         reg_password = st.text_input("Password", type="password", key="reg_password")
         reg_password_confirm = st.text_input("Confirm Password", type="password", key="reg_password_confirm")
-        
+    
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Create Account", key="register_btn"):
@@ -587,16 +588,16 @@ with st.sidebar:
                         st.success(message)
                     else:
                         st.error(message)
-        
+    
         with col2:
             if st.button("Cancel", key="cancel_register"):
                 st.session_state.show_login = False
-                st.rerun()
+                rerun_fragment()
     
     elif not st.session_state.guest_mode:
         # User is authenticated with email/password
         st.markdown(f"### 👤 {st.session_state.user_email}")
-        
+    
         if st.button("Sign Out", key="signout_btn", use_container_width=True):
             st.session_state.authenticated = False
             st.session_state.user_email = ""
@@ -604,23 +605,108 @@ with st.sidebar:
             st.session_state.guest_mode = True
             st.session_state.show_login = False
             # Create new guest user
-            guest_id = create_guest_user()
+            create_guest_user()
             st.rerun()
-    
-    # Chat history display for all users (including guests) - limit to save memory
+
+@st.fragment(run_every=HISTORY_REFRESH_INTERVAL)
+def history_panel():
+    """One page of saved chat history, refreshed periodically to pick up new turns"""
+    # Chat history display for all users (including guests) - one page read at a time
     st.markdown("### 📜 Chat History")
     
-    user_history = get_user_history(st.session_state.user_email, limit=5)  # Reduce from 10 to 5
-    if user_history:
-        for i, entry in enumerate(reversed(user_history)):  # Already limited to 5
-            with st.expander(f"Chat {len(user_history)-i}", expanded=False):
+    # Cursors of the pages visited so far; reset whenever the signed-in user changes
+    if st.session_state.get("history_user") != st.session_state.user_email:
+        st.session_state.history_user = st.session_state.user_email
+        st.session_state.history_cursors = [None]
+    
+    history_page, next_cursor = get_chat_service().history_page(
+        st.session_state.user_email,
+        before=st.session_state.history_cursors[-1]
+    )
+    if history_page:
+        for entry in history_page:
+            with st.expander(f"💬 {entry['timestamp'][:16].replace('T', ' ')}", expanded=False):
                 st.write(f"**Prompt:** {entry['prompt'][:50]}...")  # Reduce from 100 to 50 chars
                 st.write(f"**Model:** {entry['model']}")
                 st.write(f"**Date:** {entry['timestamp'][:19]}")
+    
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(st.session_state.history_cursors) > 1:
+                if st.button("⬅️ Newer", key="history_newer", use_container_width=True):
+                    st.session_state.history_cursors.pop()
+                    rerun_fragment()
+        with col2:
+            if next_cursor is not None:
+                if st.button("Older ➡️", key="history_older", use_container_width=True):
+                    st.session_state.history_cursors.append(next_cursor)
+                    rerun_fragment()
     else:
         st.write("No chat history yet")
     
     # Show additional info for guest users
     if st.session_state.guest_mode:
         st.markdown("### 🔒 Guest Info")
-        st.write("💡 Sign in with email to permanently save your chat history across sessions!")
\ No newline at end of file
+        st.write("💡 Sign in with email to permanently save your chat history across sessions!")
+
+def main():
+    """Render the page; runs only when Streamlit executes this file, never on import"""
+    # Start of this full-page run, for the rerun timing readout
+    app_run_started = time.perf_counter()
+    
+    # Streamlit configuration
+    st.set_page_config(
+        page_title="LLM-library Chat Test",
+        page_icon="🤖",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
+    
+    # Initialize session state with memory optimization
+    if "authenticated" not in st.session_state:
+        st.session_state.authenticated = False
+    if "user_email" not in st.session_state:
+        st.session_state.user_email = ""
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = []
+    if "show_login" not in st.session_state:
+        st.session_state.show_login = False
+    if "session_id" not in st.session_state:
+        # Identifies this browser session for fair scheduling in the request engine
+        st.session_state.session_id = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
+    if "guest_mode" not in st.session_state:
+        st.session_state.guest_mode = True
+        # Only create guest user if not already authenticated
+        if not st.session_state.authenticated:
+            create_guest_user()
+    
+    service = get_chat_service()
+    # Keep this guest's in-memory session alive; recreate it if it expired while idle
+    if st.session_state.guest_mode and st.session_state.user_email:
+        service.touch_guest(st.session_state.user_email, st.session_state.session_id)
+    
+    # Guest and history expiry runs on the per-process maintenance schedule, not per rerun
+    service.start_maintenance()
+    
+    # Main page title
+    st.markdown("""
+        <div class="main-title">
+            LLM-library Chat Test
+        </div>
+        """, unsafe_allow_html=True)
+    
+    chat_panel()
+    
+    # Sidebar sections rerun independently of the chat panel and of each other
+    with st.sidebar:
+        status_panel()
+        auth_panel()
+        history_panel()
+    
+    # Full-page rerun time, compared against chat-panel-only reruns in the status panel
+    record_rerun_time("app", time.perf_counter() - app_run_started)
+
+# Streamlit runs this file as __main__; importing it (tests, tools) only defines the functions
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Batch Runner for LLM-library Chat Test
+Streams a JSONL file of prompts through the same completion path as the
+Send button (ChatService: context fitting, response cache, request engine
+and failover) with bounded parallelism and an optional request-rate cap.
+Every finished row is appended to the output JSONL straight away; rows
+already answered there are skipped on the next run, so an interrupted
+batch resumes where it stopped and failed rows are retried.
+
+Input rows: {"id": "q1", "prompt": "...", "model": "...", "history": [...]}
+(a row's "model" overrides --models; see --prompt-field and --id-field)
+
+Usage: python batch_runner.py prompts.jsonl --models llama-3.1-8b-instant --output results.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from chat_service import ChatService
+from request_engine import TokenBucket
+from telemetry import percentile
+
+# Session the batch is queued under in the request engine
+BATCH_SESSION_ID = "batch"
+
+
+# Colors for output
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    CYAN = '\033[96m'
+    BOLD = '\033[1m'
+    END = '\033[0m'
+
+
+def log(message, color=Colors.CYAN):
+    print(f"{color}{message}{Colors.END}")
+
+
+def read_rows(path, prompt_field="prompt", id_field="id"):
+    """Yield (row_id, line_number, row) per input line; rows without a usable prompt yield row None"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield str(line_number), line_number, None
+                continue
+            if not isinstance(row, dict) or not isinstance(row.get(prompt_field), str) or not row[prompt_field].strip():
+                yield str(line_number), line_number, None
+                continue
+            # Rows without an id are keyed by line number, so edit such files only by appending
+            row_id = row.get(id_field)
+            yield str(row_id if row_id is not None else line_number), line_number, row
+
+
+def load_checkpoint(path):
+    """(row id, model) pairs already answered in an earlier run's output"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Last line of a run that was killed mid-write
+                continue
+            if isinstance(record, dict) and not record.get("error"):
+                done.add((str(record.get("id")), record.get("requested_model")))
+    return done
+
+
+class ResultWriter:
+    """Appends one JSON line per finished row, flushed immediately"""
+
+    def __init__(self, path):
+        self.file = open(path, "a+b")
+        # Terminate a line cut short by a crash so the next record starts on its own line
+        if self.file.tell():
+            self.file.seek(-1, os.SEEK_END)
+            if self.file.read(1) != b"\n":
+                self.file.write(b"\n")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+async def run_row(service, row_id, line_number, row, prompt_field, model, email):
+    """Send one prompt and return its output record (failures are recorded, not raised)"""
+    record = {"id": row_id, "line": line_number, "requested_model": model}
+    history = row.get("history") or ()
+    start = time.perf_counter()
+    try:
+        reply = await service.asend(BATCH_SESSION_ID, row[prompt_field], model, history, email=email)
+        summary = reply.to_dict()
+        record.update(
+            model=summary["model"],
+            content=summary["content"],
+            cached=summary["cached"],
+            api_latency=summary["latency"],
+            usage=summary["usage"]
+        )
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    # Wall time for the row: engine queueing, retries, the API call and storage
+    record["latency"] = round(time.perf_counter() - start, 6)
+    record["finished_at"] = time.time()
+    return record
+
+
+async def run_batch(service, rows, models, writer, done=frozenset(), concurrency=8, rpm=0,
+                    prompt_field="prompt", email=None, quiet=False):
+    """Dispatch rows × models with at most `concurrency` in flight; returns the run statistics"""
+    stats = {"ok": 0, "failed": 0, "skipped": 0, "invalid": 0, "latencies": [], "tokens": {"prompt": 0, "completion": 0}}
+    semaphore = asyncio.Semaphore(concurrency)
+    # Smooth pacing (no burst) on top of the engine's own per-model limits
+    bucket = TokenBucket(rpm, capacity=1) if rpm else None
+    tasks = set()
+
+    async def process(row_id, line_number, row, model):
+        try:
+            record = await run_row(service, row_id, line_number, row, prompt_field, model, email)
+        finally:
+            semaphore.release()
+        writer.write(record)
+        stats["latencies"].append(record["latency"])
+        if record.get("error"):
+            stats["failed"] += 1
+            log(f"⚠️  {row_id} [{model}]: {record['error'][:200]}", Colors.YELLOW)
+            return
+        stats["ok"] += 1
+        for kind in stats["tokens"]:
+            stats["tokens"][kind] += (record["usage"] or {}).get(kind) or 0
+        if not quiet:
+            cached = " (cached)" if record["cached"] else ""
+            log(f"✅ {row_id} [{record['model']}] {record['latency']:.2f} s{cached}", Colors.GREEN)
+
+    # Rows are read lazily: only the in-flight ones are held in memory
+    for row_id, line_number, row in rows:
+        if row is None:
+            stats["invalid"] += 1
+            log(f"⚠️  Line {line_number}: not a JSON object with a '{prompt_field}' string, skipped", Colors.YELLOW)
+            continue
+        row_models = [row["model"]] if isinstance(row.get("model"), str) and row["model"] else models
+        if not row_models:
+            stats["invalid"] += 1
+            log(f"⚠️  Line {line_number}: no 'model' in the row and no --models given, skipped", Colors.YELLOW)
+            continue
+        for model in row_models:
+            if (row_id, model) in done:
+                stats["skipped"] += 1
+                continue
+            await semaphore.acquire()
+            if bucket:
+                await bucket.acquire()
+            task = asyncio.ensure_future(process(row_id, line_number, row, model))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the chat service")
+    parser.add_argument("input", help="JSONL file with one prompt object per line")
+    parser.add_argument("--output", help="Results JSONL, appended to and used to resume (default: <input>.results.jsonl)")
+    parser.add_argument("--models", default="", help="Comma-separated models to run every row against (a row's own 'model' wins)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Rows in flight at once")
+    parser.add_argument("--rpm", type=float, default=0, help="Most requests started per minute across the batch (0 = engine limits only)")
+    parser.add_argument("--prompt-field", default="prompt", help="Row field holding the prompt")
+    parser.add_argument("--id-field", default="id", help="Row field identifying the row (default: line number)")
+    parser.add_argument("--email", help="Save answered rows to this registered account's chat history")
+    parser.add_argument("--quiet", action="store_true", help="Only report failures and the summary")
+    args = parser.parse_args(argv)
+
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if not os.path.exists(args.input):
+        log(f"❌ Input file not found: {args.input}", Colors.RED)
+        return 2
+
+    service = ChatService()
+    if args.email and not service.users.exists(args.email):
+        log(f"❌ No registered account for {args.email}", Colors.RED)
+        service.close()
+        return 2
+
+    done = load_checkpoint(output_path)
+    log(f"\n{Colors.BOLD}📦 Batch: {args.input} → {output_path} "
+        f"(concurrency {args.concurrency}{f', {args.rpm:g} rpm' if args.rpm else ''}){Colors.END}")
+    if done:
+        log(f"Resuming: {len(done)} rows already answered")
+
+    rows = read_rows(args.input, args.prompt_field, args.id_field)
+    writer = ResultWriter(output_path)
+    start = time.perf_counter()
+    try:
+        stats = asyncio.run(run_batch(
+            service, rows, models, writer, done,
+            concurrency=args.concurrency,
+            rpm=args.rpm,
+            prompt_field=args.prompt_field,
+            email=args.email,
+            quiet=args.quiet
+        ))
+    except KeyboardInterrupt:
+        # Rows still in flight were never written, so the next run picks them up
+        log("\n⚠️  Interrupted; rerun the same command to resume", Colors.YELLOW)
+        return 130
+    finally:
+        writer.close()
+        service.close()
+    wall_time = time.perf_counter() - start
+
+    latencies = sorted(stats["latencies"])
+    log(f"\n{Colors.BOLD}Summary{Colors.END}")
+    log(f"Answered {stats['ok']}, failed {stats['failed']}, already done {stats['skipped']}, "
+        f"invalid {stats['invalid']} in {wall_time:.1f} s "
+        f"({(stats['ok'] + stats['failed']) / wall_time if wall_time else 0:.2f} rows/s)")
+    if latencies:
+        log(f"Row latency p50 {percentile(latencies, 0.50):.2f} s · p95 {percentile(latencies, 0.95):.2f} s · "
+            f"max {latencies[-1]:.2f} s")
+    log(f"Tokens: {stats['tokens']['prompt']} prompt, {stats['tokens']['completion']} completion")
+    if stats["failed"]:
+        log("⚠️  Failed rows are retried when the same command is run again", Colors.YELLOW)
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
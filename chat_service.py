@@ -0,0 +1,636 @@
+"""
+Chat service for LLM-library Chat Test
+The UI-free core behind the Streamlit page, benchmarks and other callers:
+chat turns (blocking, streaming and side-by-side compare) through the
+shared request engine and response cache, accounts and guest sessions,
+and chat history. Every component - API client, stores, background
+threads - is created on first use, so importing this module or
+constructing a service does no I/O.
+"""
+
+import os
+import asyncio
+import datetime
+import threading
+import concurrent.futures
+
+from chat_store import HISTORY_DB_PATH, HistoryStore, UserRepository
+from context_window import build_context
+from guest_sessions import GUEST_SESSION_TTL, GuestSessionStore
+from health_monitor import HealthMonitor
+from http_client import GROQ_BASE_URL, request_with_retries
+from maintenance import MAINTENANCE_BATCH_SIZE, MaintenanceJob
+from model_catalog import MODEL_CATALOG_PATH, CatalogStore
+from passwords import AuthBusyError, HashingPool, needs_rehash
+from request_engine import ENGINE_REQUEST_TIMEOUT, RequestEngine
+from response_cache import ResponseCache, cache_key
+from telemetry import get_telemetry, traced
+
+PLACEHOLDER_API_KEY = "gsk_YOUR_API_KEY_HERE_REPLACE_THIS_PLACEHOLDER"
+
+# Sampling temperature for chat completions
+CHAT_TEMPERATURE = 0.7
+
+# Gentle response length guidance sent ahead of every conversation
+SYSTEM_PROMPT = {
+    "role": "system",
+    "content": "Please provide helpful and informative responses. Try to keep your answers reasonably concise when possible, but feel free to elaborate when needed to fully address the question."
+}
+
+# Stored chat history older than this many days is expired (0 keeps it forever)
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+
+# Chat history entries per page
+HISTORY_PAGE_SIZE = 5
+
+# Seconds between background API health probes
+HEALTH_CHECK_INTERVAL = float(os.getenv("GROQ_HEALTH_INTERVAL", "60"))
+
+# Longest a first start without a saved model catalog waits for the live list
+MODEL_CATALOG_COLD_START_WAIT = 5
+
+# Legacy single-file store, imported into the SQLite store on first use
+USERS_JSON_PATH = "users.json"
+
+# Offered when the model list can't be fetched and no saved copy exists
+FALLBACK_MODELS = {
+    "llama-3.1-8b-instant": "Llama 3.1 8B Instant",
+    "llama-3.3-70b-versatile": "Llama 3.3 70B Versatile",
+    "meta-llama/llama-4-scout-17b-16e-instruct": "Llama 4 Scout 17B",
+    "meta-llama/llama-4-maverick-17b-128e-instruct": "Llama 4 Maverick 17B",
+    "openai/gpt-oss-120b": "GPT-OSS 120B",
+    "openai/gpt-oss-20b": "GPT-OSS 20B",
+    "qwen/qwen3-32b": "Qwen3 32B",
+    "moonshotai/kimi-k2-instruct": "Kimi K2 Instruct"
+}
+
+
+def resolve_api_key():
+    """API key from the environment, or the placeholder (with a warning)"""
+    api_key = os.getenv("GROQ_API_KEY")
+    if api_key:
+        return api_key
+    print("⚠️  WARNING: Using placeholder API key. Set GROQ_API_KEY environment variable for production!")
+    return PLACEHOLDER_API_KEY
+
+
+def record_job_timings(span, job):
+    """Copy an engine job's queueing/first-token/API timings, token usage and served model onto a span"""
+    for phase, seconds in job.timings().items():
+        span.phase(phase, seconds)
+    span.usage(job.usage)
+    span.set(model=job.served_model or job.model, attempts=job.attempts)
+
+
+class ChatReply:
+    """One chat turn; iterate it for text deltas, or wait() for the finished reply
+
+    content, model (the one that answered), usage and latency are set once
+    the reply is complete. A cached or blocking reply yields its whole
+    text as a single delta. Replies from astream() are iterated with
+    'async for' instead.
+    """
+
+    def __init__(self, prompt, model, email, messages, request_key, context_report, span, owns_span):
+        self.prompt = prompt
+        self.requested_model = model
+        self.model = model
+        self.email = email
+        self.messages = messages
+        self.request_key = request_key
+        self.context_report = context_report
+        self.span = span
+        self.owns_span = owns_span
+        self.content = None
+        self.cached = False
+        self.usage = None
+        self.latency = None
+        self.done = False
+        self._deltas = None
+
+    def __iter__(self):
+        return self._deltas
+
+    def __aiter__(self):
+        return self._deltas
+
+    def wait(self):
+        """Consume any remaining deltas and return the finished reply"""
+        for _ in self._deltas:
+            pass
+        return self
+
+    def to_dict(self):
+        """JSON-friendly summary of a finished reply"""
+        return {
+            "content": self.content,
+            "model": self.model,
+            "requested_model": self.requested_model,
+            "cached": self.cached,
+            "latency": self.latency,
+            "usage": _usage_dict(self.usage),
+            "context": self.context_report
+        }
+
+
+async def _single_delta(content):
+    yield content
+
+
+def _usage_dict(usage):
+    """Token counts from an SDK usage object or dict"""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return {kind: usage.get(f"{kind}_tokens") for kind in ("prompt", "completion", "total")}
+    return {kind: getattr(usage, f"{kind}_tokens", None) for kind in ("prompt", "completion", "total")}
+
+
+class ChatService:
+    """Chat, account and history operations with lazily created components
+
+    Components are shared by every caller of one service, so one service
+    per process is the intended use (the Streamlit page keeps its instance
+    in st.cache_resource). Paths and the API key default to the same
+    settings the app uses.
+    """
+
+    def __init__(self, api_key=None, history_path=HISTORY_DB_PATH, users_json_path=USERS_JSON_PATH,
+                 catalog_path=MODEL_CATALOG_PATH, base_url=None):
+        self._api_key = api_key
+        # None uses GROQ_BASE_URL
+        self.base_url = base_url
+        self.history_path = history_path
+        self.users_json_path = users_json_path
+        self.catalog_path = catalog_path
+        # Reentrant: building one component may build the ones it depends on
+        self._lock = threading.RLock()
+        self._components = {}
+        self._users_snapshot = None
+
+    def _component(self, name, factory):
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    component = factory()
+                    self._components[name] = component
+        return component
+
+    # --- Components ---
+
+    @property
+    def api_key(self):
+        """Groq API key, resolved on first use"""
+        if self._api_key is None:
+            self._api_key = resolve_api_key()
+        return self._api_key
+
+    @property
+    def engine(self):
+        """Request engine that every completion is submitted to"""
+        return self._component("engine", lambda: RequestEngine(self.api_key, base_url=self.base_url))
+
+    @property
+    def history_store(self):
+        """Chat history store, migrated from users.json on first use"""
+        def create():
+            store = HistoryStore(self.history_path)
+            store.migrate_from_users_json(self.users_json_path)
+            return store
+        return self._component("history_store", create)
+
+    @property
+    def users(self):
+        """User repository, with accounts imported from users.json on first use"""
+        def create():
+            repository = UserRepository(self.history_store)
+            repository.migrate_from_users_json(self.users_json_path)
+            return repository
+        return self._component("users", create)
+
+    @property
+    def guests(self):
+        """In-memory guest sessions"""
+        return self._component("guests", GuestSessionStore)
+
+    @property
+    def response_cache(self):
+        """Completion cache shared by every caller"""
+        return self._component("response_cache", ResponseCache)
+
+    @property
+    def hashing_pool(self):
+        """Bounded pool that runs password hashing off the caller's thread"""
+        return self._component("hashing_pool", HashingPool)
+
+    @property
+    def catalog_store(self):
+        """Last good model catalog, loaded from disk on a cold start"""
+        return self._component("catalog_store", lambda: CatalogStore(FALLBACK_MODELS, self.catalog_path))
+
+    @property
+    def health_monitor(self):
+        """API health monitor, started on first use; each successful probe revalidates the catalog"""
+        def create():
+            monitor = HealthMonitor(self.probe, interval=HEALTH_CHECK_INTERVAL, on_payload=self.catalog_store.update)
+            monitor.start()
+            return monitor
+        return self._component("health_monitor", create)
+
+    def start_maintenance(self):
+        """Start the scheduled guest and history expiry for this process (idempotent)"""
+        def create():
+            job = MaintenanceJob()
+            job.add_task("guest_sessions", lambda batch_size: self.guests.reap(limit=batch_size))
+            job.add_task("stored_guests", self.cleanup_guest_users)
+            if HISTORY_RETENTION_DAYS > 0:
+                job.add_task("chat_history", self.expire_old_history)
+            return job
+        job = self._component("maintenance", create)
+        job.start()
+        return job
+
+    def close(self):
+        """Stop background threads and close the stores that were opened"""
+        for name in ("health_monitor", "maintenance"):
+            if name in self._components:
+                self._components[name].stop()
+        for name in ("users", "history_store"):
+            if name in self._components:
+                self._components[name].close()
+
+    # --- Models ---
+
+    @traced("metadata.models")
+    def probe(self):
+        """Fetch the Groq model list and return (ok, status message, models data)"""
+        try:
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+            base_url = (self.base_url or GROQ_BASE_URL).rstrip("/")
+            response = request_with_retries("GET", f"{base_url}/openai/v1/models", headers=headers)
+            if response.status_code == 200:
+                models_data = response.json()
+                models_count = len(models_data.get("data", []))
+                return True, f"API Connected - {models_count} models available", models_data
+            else:
+                return False, f"API Error: {response.status_code}", None
+        except Exception as e:
+            return False, f"Connection Error: {str(e)[:50]}", None
+
+    def api_status(self):
+        """Probe the API now and return the monitor's status"""
+        return self.health_monitor.refresh()
+
+    def catalog(self):
+        """Current model catalog; the health monitor revalidates it in the background"""
+        store = self.catalog_store
+        monitor = self.health_monitor
+        # Only a first start with no saved catalog waits (briefly) for the live list
+        if store.source == "fallback":
+            monitor.wait_until_checked(timeout=MODEL_CATALOG_COLD_START_WAIT)
+        return store.current()
+
+    def models(self):
+        """Available models as {id: display name}"""
+        store = self.catalog_store
+        if store.source != "live":
+            # Nothing fetched in this process yet: fetch now (the monitor feeds the store)
+            self.health_monitor.refresh()
+        return store.current().display_names()
+
+    def context_window(self, model):
+        """Context window for a model from the catalog, without a network call"""
+        return self.catalog().context_window(model)
+
+    # --- Chat ---
+
+    def _start_turn(self, prompt, model, history, email, span, stream):
+        owns_span = span is None
+        if owns_span:
+            span = get_telemetry().span("chat.turn", model=model, stream=stream)
+        conversation = list(history) + [{"role": "user", "content": prompt}]
+        try:
+            # Combine system prompt with the newest chat history that fits the model's budget
+            with span.measure("context"):
+                messages, context_report = build_context(SYSTEM_PROMPT, conversation, self.context_window(model))
+            # Identical conversations sent to the same model are answered from the cache
+            with span.measure("cache"):
+                request_key = cache_key(model, messages, CHAT_TEMPERATURE)
+                cached = self.response_cache.get(request_key)
+        except Exception as e:
+            span.fail(e)
+            if owns_span:
+                span.finish()
+            raise
+        reply = ChatReply(prompt, model, email, messages, request_key, context_report, span, owns_span)
+        if cached is not None:
+            reply.content = cached
+            reply.cached = True
+        return reply
+
+    def _finish_turn(self, reply, job=None):
+        if job is not None:
+            record_job_timings(reply.span, job)
+            # The engine may fail over to a fallback model; record who answered
+            reply.model = job.served_model or reply.requested_model
+            reply.usage = job.usage
+            reply.latency = job.latency
+        # Only replies from the requested model may answer future requests for it
+        if not reply.cached and reply.model == reply.requested_model:
+            self.response_cache.put(reply.request_key, reply.content)
+        if reply.email:
+            with reply.span.measure("persist"):
+                self.save_prompt(reply.email, reply.prompt, reply.content, reply.model)
+        reply.span.set(cached=reply.cached, requested_model=reply.requested_model)
+        reply.done = True
+        if reply.owns_span:
+            reply.span.finish()
+
+    def _fail_turn(self, reply, error):
+        reply.span.fail(error)
+        if reply.owns_span:
+            reply.span.finish()
+
+    def send(self, session_id, prompt, model, history=(), email=None, span=None):
+        """Answer one chat turn, waiting for the full reply
+
+        history is the earlier conversation as role/content dicts. The turn
+        is saved to email's history when given. Pass span to record the
+        turn's phases on a caller-owned span (the caller finishes it);
+        otherwise the service records its own chat.turn span.
+        """
+        reply = self._start_turn(prompt, model, history, email, span, stream=False)
+        try:
+            if not reply.cached:
+                job = self.engine.submit(session_id, model, reply.messages, temperature=CHAT_TEMPERATURE)
+                completion = self.engine.wait(job)
+                reply.content = completion.choices[0].message.content
+                self._finish_turn(reply, job)
+            else:
+                self._finish_turn(reply)
+        except Exception as e:
+            self._fail_turn(reply, e)
+            raise
+        reply._deltas = iter([reply.content])
+        return reply
+
+    def stream(self, session_id, prompt, model, history=(), email=None, span=None):
+        """Start a chat turn whose reply yields text deltas as they arrive
+
+        Arguments are as for send(). The turn is cached and saved once the
+        stream is fully consumed; stopping early cancels generation.
+        """
+        reply = self._start_turn(prompt, model, history, email, span, stream=True)
+        job = None
+        if not reply.cached:
+            job = self.engine.submit(session_id, model, reply.messages, stream=True, temperature=CHAT_TEMPERATURE)
+        reply._deltas = self._stream_deltas(reply, job)
+        return reply
+
+    def _stream_deltas(self, reply, job):
+        try:
+            if job is None:
+                yield reply.content
+                self._finish_turn(reply)
+                return
+            parts = []
+            for delta in self.engine.iter_stream(job):
+                parts.append(delta)
+                yield delta
+            reply.content = "".join(parts)
+            self._finish_turn(reply, job)
+        except GeneratorExit:
+            # The caller stopped reading; the engine cancels the job
+            self._fail_turn(reply, "cancelled")
+            raise
+        except Exception as e:
+            self._fail_turn(reply, e)
+            raise
+
+    async def asend(self, session_id, prompt, model, history=(), email=None, span=None):
+        """send() for asyncio servers; storage steps run in the default executor and
+        no thread is held while the model generates"""
+        loop = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(None, self._start_turn, prompt, model, history, email, span, False)
+        try:
+            job = None
+            if not reply.cached:
+                job = self.engine.submit(session_id, model, reply.messages, temperature=CHAT_TEMPERATURE)
+                completion = await self.engine.aresult(job)
+                reply.content = completion.choices[0].message.content
+            await loop.run_in_executor(None, self._finish_turn, reply, job)
+        except Exception as e:
+            self._fail_turn(reply, e)
+            raise
+        reply._deltas = _single_delta(reply.content)
+        return reply
+
+    async def astream(self, session_id, prompt, model, history=(), email=None, span=None):
+        """stream() for asyncio servers; iterate the reply with 'async for'"""
+        loop = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(None, self._start_turn, prompt, model, history, email, span, True)
+        job = None
+        if not reply.cached:
+            job = self.engine.submit(session_id, model, reply.messages, stream=True, temperature=CHAT_TEMPERATURE)
+        reply._deltas = self._astream_deltas(reply, job)
+        return reply
+
+    async def _astream_deltas(self, reply, job):
+        try:
+            if job is None:
+                yield reply.content
+            else:
+                parts = []
+                async for delta in self.engine.aiter_stream(job):
+                    parts.append(delta)
+                    yield delta
+                reply.content = "".join(parts)
+            await asyncio.get_running_loop().run_in_executor(None, self._finish_turn, reply, job)
+        except GeneratorExit:
+            self._fail_turn(reply, "cancelled")
+            raise
+        except Exception as e:
+            self._fail_turn(reply, e)
+            raise
+
+    def compare(self, session_id, prompt, models, email=None):
+        """Send one prompt to several models at once, yielding each model's result as it completes
+
+        Results are dicts with model and content (or error), cached, and
+        latency/usage for fresh replies. No failover: each result must come
+        from the model it is labelled with. Successful replies are saved to
+        email's history, one entry per model, once all have finished.
+        """
+        messages = [{"role": "system", "content": SYSTEM_PROMPT["content"]}, {"role": "user", "content": prompt}]
+        telemetry = get_telemetry()
+
+        results = {}
+        pending = {}
+        for model_id in models:
+            request_key = cache_key(model_id, messages, CHAT_TEMPERATURE)
+            cached = self.response_cache.get(request_key)
+            if cached is not None:
+                results[model_id] = {"model": model_id, "content": cached, "cached": True}
+                yield results[model_id]
+            else:
+                # All jobs are queued at once; the engine runs them concurrently
+                job = self.engine.submit(session_id, model_id, messages, failover=False, temperature=CHAT_TEMPERATURE)
+                span = telemetry.span("chat.compare", model=model_id)
+                pending[job.future] = (model_id, job, request_key, span)
+
+        try:
+            for future in concurrent.futures.as_completed(pending, timeout=ENGINE_REQUEST_TIMEOUT):
+                model_id, job, request_key, span = pending[future]
+                try:
+                    completion = future.result()
+                    record_job_timings(span, job)
+                    content = completion.choices[0].message.content
+                    self.response_cache.put(request_key, content)
+                    results[model_id] = {
+                        "model": model_id,
+                        "content": content,
+                        "cached": False,
+                        "latency": job.latency,
+                        "usage": completion.usage
+                    }
+                except Exception as e:
+                    span.fail(e)
+                    results[model_id] = {"model": model_id, "error": str(e)}
+                span.finish()
+                yield results[model_id]
+        except concurrent.futures.TimeoutError:
+            for model_id, job, request_key, span in pending.values():
+                if model_id not in results:
+                    job.cancelled.set()
+                    span.fail("timeout")
+                    span.finish()
+                    results[model_id] = {"model": model_id, "error": "Timed out waiting for the model"}
+                    yield results[model_id]
+
+        if email:
+            for model_id in models:
+                if not results[model_id].get("error"):
+                    self.save_prompt(email, prompt, results[model_id]["content"], model_id)
+
+    # --- Accounts ---
+
+    @traced("auth.authenticate")
+    def authenticate(self, email, password):
+        """Check credentials; returns (ok, message)"""
+        user = self.users.get(email)
+        if user is not None:
+            try:
+                valid = self.hashing_pool.verify_password(password, user["password"])
+                if valid and needs_rehash(user["password"]):
+                    # Transparently upgrade legacy SHA-256 (or outdated scrypt cost) hashes
+                    self.users.update_password(email, self.hashing_pool.hash_password(password))
+            except AuthBusyError as e:
+                return False, str(e)
+            if valid:
+                return True, "Login successful!"
+            else:
+                return False, "Invalid password"
+        return False, "User not found"
+
+    @traced("auth.register")
+    def register(self, email, password, is_guest=False, guest_session_id=""):
+        """Create an account (or a stored guest); returns (ok, message)"""
+        if not is_guest and self.users.exists(email):
+            # Skip the expensive hash for an obvious duplicate
+            return False, "User already exists"
+        try:
+            password_hash = self.hashing_pool.hash_password(password) if password else ""
+        except AuthBusyError as e:
+            return False, str(e)
+        record = {
+            "password": password_hash,
+            "created_at": datetime.datetime.now().isoformat(),
+            "is_guest": is_guest,
+            "guest_session_id": guest_session_id if is_guest else ""
+        }
+        # The insert is a no-op for an existing account, so check and create are one step
+        if not self.users.add(email, record, replace=is_guest):
+            return False, "User already exists"
+        return True, "Registration successful!" if not is_guest else "Guest session created!"
+
+    def sign_in(self, email, password, guest_id=None):
+        """Authenticate and carry a guest's in-memory chats over to the account; returns (ok, message)"""
+        ok, message = self.authenticate(email, password)
+        if ok and guest_id:
+            self.guests.promote(guest_id, email, self.history_store)
+        return ok, message
+
+    def start_guest(self, session_id, guest_id=None):
+        """Start an in-memory guest session (no disk write) and return its guest ID"""
+        return self.guests.create(session_id, guest_id=guest_id)
+
+    def touch_guest(self, guest_id, session_id):
+        """Keep a guest session alive, recreating it if it expired while idle"""
+        if not self.guests.touch(guest_id):
+            self.guests.create(session_id, guest_id=guest_id)
+
+    def is_guest(self, email):
+        """Whether an ID belongs to a live in-memory guest"""
+        return email in self.guests
+
+    # --- History and bulk storage ---
+
+    @traced("storage.save_user_prompt")
+    def save_prompt(self, email, prompt, response, model):
+        """Save a prompt and response to a user's or guest's history"""
+        if email in self.guests:
+            self.guests.append(email, prompt, response, model)
+            return
+        if self.users.exists(email):
+            # Single append to the history store instead of rewriting users.json
+            self.history_store.append(email, prompt, response, model)
+
+    @traced("storage.get_user_history")
+    def history(self, email, limit=10):
+        """Last 'limit' history entries, oldest first"""
+        if email in self.guests:
+            return self.guests.recent(email, limit)
+        # Only the last 'limit' entries are read from the store
+        return self.users.history(email, limit)
+
+    @traced("storage.get_user_history_page")
+    def history_page(self, email, before=None, page_size=HISTORY_PAGE_SIZE):
+        """One page of history older than the 'before' cursor: (entries newest first, next_cursor)"""
+        if email in self.guests:
+            return self.guests.page(email, before, page_size)
+        return self.users.history_page(email, before, page_size)
+
+    @traced("storage.load_user_data")
+    def load_users(self):
+        """Snapshot of every user record (bulk/admin use only)"""
+        # Keyed on the store's change counter, so a write from any server process
+        # invalidates every process's cached snapshot
+        version = self.users.version()
+        snapshot = self._users_snapshot
+        if snapshot is None or snapshot[0] != version:
+            snapshot = (version, self.users.all())
+            self._users_snapshot = snapshot
+        return {email: dict(record) for email, record in snapshot[1].items()}
+
+    @traced("storage.save_user_data")
+    def save_users(self, data):
+        """Replace the stored user records with 'data' in one transaction"""
+        self.users.replace_all(data)
+
+    @traced("storage.cleanup_guest_users")
+    def cleanup_guest_users(self, batch_size=MAINTENANCE_BATCH_SIZE):
+        """Remove stored guest users older than the guest TTL - one bounded pass"""
+        # Only legacy guests created before the in-memory guest tier are ever stored
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=GUEST_SESSION_TTL)
+        return self.users.expire_guests(cutoff.isoformat(), batch_size)
+
+    @traced("storage.expire_old_history")
+    def expire_old_history(self, batch_size=MAINTENANCE_BATCH_SIZE):
+        """Remove stored chat history older than the retention period - one bounded pass"""
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=HISTORY_RETENTION_DAYS)
+        return self.history_store.expire_before(cutoff.isoformat(), batch_size)
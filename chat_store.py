@@ -0,0 +1,418 @@
+"""
+User and chat history storage for LLM-library Chat Test
+SQLite store (WAL mode) where recording a chat turn is a single append and
+user records are read by primary key, instead of loading and rewriting
+every user's data in users.json.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import datetime
+import tempfile
+import threading
+import contextlib
+
+# Advisory file locks for the legacy users.json (not available on Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HISTORY_DB_PATH = os.getenv("CHAT_HISTORY_DB", "chat_history.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    model TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_history_email ON chat_history (email, id);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+USER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    is_guest INTEGER NOT NULL DEFAULT 0,
+    guest_session_id TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_users_guest ON users (is_guest) WHERE is_guest = 1;
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+-- Bumped by every write to users so any process can tell its cached snapshot is stale
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('users_version', '0');
+CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'users_version';
+END;
+CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE ON users BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'users_version';
+END;
+CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users BEGIN
+    UPDATE store_meta SET value = value + 1 WHERE key = 'users_version';
+END;
+"""
+
+USER_COLUMNS = "email, password, created_at, is_guest, guest_session_id"
+
+WAL_SWITCH_ATTEMPTS = 50
+
+
+def connect(path):
+    """Open a SQLite connection configured for concurrent readers and appenders"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers proceed while another session appends a turn. Switching a new
+    # database to WAL takes an exclusive lock and SQLite reports contention as "locked"
+    # without waiting on the busy timeout, so retry when several processes start at once.
+    for attempt in range(WAL_SWITCH_ATTEMPTS):
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            break
+        except sqlite3.OperationalError:
+            if attempt == WAL_SWITCH_ATTEMPTS - 1:
+                raise
+            time.sleep(0.1)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextlib.contextmanager
+def write_transaction(conn):
+    """Run a group of statements as one BEGIN IMMEDIATE transaction
+
+    Taking the write lock up front makes writers from other server
+    processes wait on the busy timeout instead of failing part-way.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@contextlib.contextmanager
+def locked_file(path):
+    """Hold an exclusive advisory lock on '<path>.lock' across processes"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over 'path' so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class HistoryStore:
+    """Per-user chat history with O(1) appends and indexed reads"""
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def append(self, email, prompt, response, model, timestamp=None):
+        """Record one chat turn for a user"""
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chat_history (email, timestamp, prompt, response, model) VALUES (?, ?, ?, ?, ?)",
+                (email, timestamp, prompt, response, model)
+            )
+
+    def recent(self, email, limit=10):
+        """Return the last 'limit' entries for a user, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT timestamp, prompt, response, model FROM chat_history "
+                "WHERE email = ? ORDER BY id DESC LIMIT ?",
+                (email, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def page(self, email, before=None, page_size=5):
+        """Return (entries newest first, next_cursor) for one page of a user's history
+
+        The cursor is the row id of the oldest entry on the page; pass it as
+        'before' to fetch the next older page. next_cursor is None on the
+        last page. Only page_size + 1 rows are read per call.
+        """
+        query = "SELECT id, timestamp, prompt, response, model FROM chat_history WHERE email = ?"
+        params = [email]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(page_size + 1)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        entries = [dict(row) for row in rows[:page_size]]
+        next_cursor = entries[-1]["id"] if len(rows) > page_size else None
+        return entries, next_cursor
+
+    def delete_users(self, emails):
+        """Drop all history entries belonging to the given users"""
+        emails = list(emails)
+        if not emails:
+            return
+        with self._lock, write_transaction(self._conn):
+            self._conn.executemany("DELETE FROM chat_history WHERE email = ?", [(e,) for e in emails])
+
+    def expire_before(self, cutoff, limit=500):
+        """Delete up to 'limit' of the oldest entries timestamped before 'cutoff'
+
+        Returns (scanned, removed). The timestamp index is created on first
+        use, so deployments without a retention policy don't pay for it.
+        """
+        with self._lock:
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history (timestamp)"
+            )
+            with write_transaction(self._conn):
+                ids = [
+                    (row["id"],) for row in self._conn.execute(
+                        "SELECT id FROM chat_history WHERE timestamp < ? ORDER BY timestamp LIMIT ?",
+                        (cutoff, limit)
+                    )
+                ]
+                self._conn.executemany("DELETE FROM chat_history WHERE id = ?", ids)
+        return len(ids), len(ids)
+
+    def migrate_from_users_json(self, users_path="users.json"):
+        """One-time import of chat_history lists from the legacy users.json layout"""
+        if not os.path.exists(users_path):
+            return 0
+
+        # The file lock keeps other processes from rewriting users.json mid-read;
+        # BEGIN IMMEDIATE makes sure only one of them performs the migration
+        with locked_file(users_path), self._lock:
+            with write_transaction(self._conn):
+                done = self._conn.execute(
+                    "SELECT value FROM store_meta WHERE key = 'users_json_migrated'"
+                ).fetchone()
+                if done:
+                    return 0
+
+                with open(users_path, "r") as f:
+                    users = json.load(f)
+
+                rows = []
+                for email, user_data in users.items():
+                    for entry in user_data.get("chat_history", []):
+                        rows.append((
+                            email,
+                            entry.get("timestamp", ""),
+                            entry.get("prompt", ""),
+                            entry.get("response", ""),
+                            entry.get("model", "")
+                        ))
+                self._conn.executemany(
+                    "INSERT INTO chat_history (email, timestamp, prompt, response, model) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute(
+                    "INSERT INTO store_meta (key, value) VALUES ('users_json_migrated', ?)",
+                    (datetime.datetime.now().isoformat(),)
+                )
+
+            # History now lives in the store; shrink users.json down to account records.
+            # The marker above is committed first, so a crash here never duplicates rows.
+            if any("chat_history" in user_data for user_data in users.values()):
+                for user_data in users.values():
+                    user_data.pop("chat_history", None)
+                write_json_atomic(users_path, users)
+        return len(rows)
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+def _user_record(row):
+    """Convert a users row into the record dict used by the app"""
+    return {
+        "password": row["password"],
+        "created_at": row["created_at"],
+        "is_guest": bool(row["is_guest"]),
+        "guest_session_id": row["guest_session_id"]
+    }
+
+
+def _user_row(email, record):
+    """Convert a record dict into a users row tuple"""
+    return (
+        email,
+        record.get("password", ""),
+        record.get("created_at") or datetime.datetime.now().isoformat(),
+        int(record.get("is_guest", False)),
+        record.get("guest_session_id", "")
+    )
+
+
+class UserRepository:
+    """Keyed access to user records and each user's recent history
+
+    Lookups go through the primary key, so a login or sidebar render costs
+    the same regardless of how many users or history entries exist.
+    """
+
+    def __init__(self, history_store, path=None):
+        self.history_store = history_store
+        self.path = path or history_store.path
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.executescript(USER_SCHEMA)
+
+    def get(self, email):
+        """Return one user's record, or None if the user doesn't exist"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE email = ?", (email,)
+            ).fetchone()
+        return _user_record(row) if row else None
+
+    def exists(self, email):
+        """Whether a user record exists"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+    def add(self, email, record, replace=False):
+        """Insert a user record; returns False if it exists and replace is not set"""
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            cursor = self._conn.execute(
+                f"{verb} INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                _user_row(email, record)
+            )
+            return cursor.rowcount > 0
+
+    def update_password(self, email, password_hash):
+        """Replace a user's stored password hash"""
+        with self._lock:
+            self._conn.execute("UPDATE users SET password = ? WHERE email = ?", (password_hash, email))
+
+    def delete(self, emails):
+        """Remove users and their chat history"""
+        emails = list(emails)
+        if not emails:
+            return
+        # Users and their history share a database, so both go in one transaction
+        with self._lock, write_transaction(self._conn):
+            params = [(e,) for e in emails]
+            self._conn.executemany("DELETE FROM users WHERE email = ?", params)
+            self._conn.executemany("DELETE FROM chat_history WHERE email = ?", params)
+
+    def expire_guests(self, cutoff, limit=500):
+        """Delete up to 'limit' stored guest users created before 'cutoff'; returns (scanned, removed)"""
+        with self._lock, write_transaction(self._conn):
+            rows = self._conn.execute(
+                "SELECT email, created_at FROM users WHERE is_guest = 1 LIMIT ?", (limit,)
+            ).fetchall()
+            expired = [(row["email"],) for row in rows if row["created_at"] < cutoff]
+            self._conn.executemany("DELETE FROM users WHERE email = ?", expired)
+            self._conn.executemany("DELETE FROM chat_history WHERE email = ?", expired)
+        return len(rows), len(expired)
+
+    def replace_all(self, users):
+        """Atomically replace every user record with the given {email: record} dict"""
+        with self._lock, write_transaction(self._conn):
+            existing = [row["email"] for row in self._conn.execute("SELECT email FROM users")]
+            removed = [(email,) for email in existing if email not in users]
+            self._conn.executemany("DELETE FROM users WHERE email = ?", removed)
+            self._conn.executemany("DELETE FROM chat_history WHERE email = ?", removed)
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                [_user_row(email, record) for email, record in users.items()]
+            )
+
+    def version(self):
+        """Change counter bumped by any process's write to users (cheap staleness check)"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = 'users_version'").fetchone()
+        return int(row["value"]) if row else 0
+
+    def guests(self):
+        """Return {email: guest_session_id} for all guest users (uses the partial index)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT email, guest_session_id FROM users WHERE is_guest = 1"
+            ).fetchall()
+        return {row["email"]: row["guest_session_id"] for row in rows}
+
+    def all(self):
+        """Return every user record keyed by email (admin/export use only)"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {USER_COLUMNS} FROM users").fetchall()
+        return {row["email"]: _user_record(row) for row in rows}
+
+    def history(self, email, limit=10):
+        """Return a user's last 'limit' history entries, oldest first"""
+        return self.history_store.recent(email, limit)
+
+    def history_page(self, email, before=None, page_size=5):
+        """Return one cursor-addressed page of a user's history, newest first"""
+        return self.history_store.page(email, before, page_size)
+
+    def migrate_from_users_json(self, users_path="users.json"):
+        """One-time import of account records from the legacy users.json layout"""
+        if not os.path.exists(users_path):
+            return 0
+
+        with locked_file(users_path), self._lock, write_transaction(self._conn):
+            done = self._conn.execute(
+                "SELECT value FROM store_meta WHERE key = 'users_json_accounts_migrated'"
+            ).fetchone()
+            if done:
+                return 0
+
+            with open(users_path, "r") as f:
+                users = json.load(f)
+
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                [_user_row(email, user_data) for email, user_data in users.items()]
+            )
+            self._conn.execute(
+                "INSERT INTO store_meta (key, value) VALUES ('users_json_accounts_migrated', ?)",
+                (datetime.datetime.now().isoformat(),)
+            )
+        return len(users)
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
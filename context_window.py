@@ -0,0 +1,78 @@
+"""
+Context window budgeting for LLM-library Chat Test
+Keeps the prompt sent to the model within a per-model token budget by
+dropping the oldest turns of a long conversation.
+"""
+
+import os
+
+# Rough heuristic for English text; avoids shipping a tokenizer per model family
+CHARS_PER_TOKEN = 4
+# Per-message framing (role markers, separators) added by chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+
+DEFAULT_CONTEXT_WINDOW = 8192
+# Tokens held back for the model's reply
+RESPONSE_RESERVE_TOKENS = int(os.getenv("CONTEXT_RESPONSE_RESERVE", "1024"))
+# Optional hard cap on prompt size regardless of the model's window (0 = no cap)
+MAX_PROMPT_TOKENS = int(os.getenv("CONTEXT_MAX_PROMPT_TOKENS", "0"))
+
+
+def estimate_tokens(message):
+    """Estimate the token cost of a chat message, caching it on the message dict"""
+    content = message.get("content") or ""
+    cached = message.get("tokens")
+    # The cache is keyed on content length so an edited message is re-estimated
+    if cached is not None and message.get("tokens_for_length") == len(content):
+        return cached
+    tokens = MESSAGE_OVERHEAD_TOKENS + (len(content) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    message["tokens"] = tokens
+    message["tokens_for_length"] = len(content)
+    return tokens
+
+
+def prompt_budget(context_window):
+    """Tokens available for the prompt given a model's context window"""
+    budget = (context_window or DEFAULT_CONTEXT_WINDOW) - RESPONSE_RESERVE_TOKENS
+    if MAX_PROMPT_TOKENS:
+        budget = min(budget, MAX_PROMPT_TOKENS)
+    return max(budget, 0)
+
+
+def api_message(message):
+    """Strip bookkeeping keys so only role/content are sent to the API"""
+    return {"role": message["role"], "content": message["content"]}
+
+
+def build_context(system_prompt, history, context_window):
+    """Select the newest history messages that fit the model's prompt budget
+
+    Returns (messages_for_api, report). The latest message is always kept,
+    and the window never starts with an assistant reply whose prompt was
+    dropped. The report says how many messages and tokens were trimmed.
+    """
+    budget = prompt_budget(context_window)
+    used = estimate_tokens(system_prompt)
+
+    kept = []
+    for message in reversed(history):
+        cost = estimate_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+
+    # Don't open the window mid-turn with an orphaned assistant reply
+    while len(kept) > 1 and kept[0]["role"] == "assistant":
+        used -= estimate_tokens(kept.pop(0))
+
+    trimmed = history[:len(history) - len(kept)]
+    report = {
+        "budget": budget,
+        "prompt_tokens": used,
+        "kept_messages": len(kept),
+        "trimmed_messages": len(trimmed),
+        "trimmed_tokens": sum(estimate_tokens(message) for message in trimmed)
+    }
+    return [api_message(system_prompt)] + [api_message(message) for message in kept], report
@@ -0,0 +1,146 @@
+"""
+Ephemeral guest sessions for LLM-library Chat Test
+Guests live in process memory with a last-activity TTL instead of being
+written to the user store on every new browser session. A guest's chat
+history is only copied to durable storage when they sign in.
+"""
+
+import os
+import time
+import random
+import string
+import datetime
+import threading
+from collections import deque, OrderedDict
+
+# Seconds of inactivity after which a guest session is expired
+GUEST_SESSION_TTL = float(os.getenv("GUEST_SESSION_TTL", "3600"))
+# Chat turns kept per guest; older turns are dropped from memory
+GUEST_HISTORY_LIMIT = int(os.getenv("GUEST_HISTORY_LIMIT", "50"))
+
+
+def generate_guest_id():
+    """Generate a random guest ID"""
+    return "Guest_" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+
+
+class _GuestSession:
+    """In-memory state for one guest"""
+
+    def __init__(self, guest_id, session_id, history_limit):
+        self.guest_id = guest_id
+        self.session_id = session_id
+        self.created_at = datetime.datetime.now().isoformat()
+        self.last_active = time.time()
+        # (seq, entry) pairs; seq is the pagination cursor and never reused
+        self.history = deque(maxlen=history_limit)
+        self.next_seq = 1
+
+
+class GuestSessionStore:
+    """Process-local guest sessions expired by last-activity time"""
+
+    def __init__(self, ttl=GUEST_SESSION_TTL, history_limit=GUEST_HISTORY_LIMIT):
+        self.ttl = ttl
+        self.history_limit = history_limit
+        self._lock = threading.Lock()
+        # Ordered by last activity (least recent first) so expiry stops at the first live session
+        self._sessions = OrderedDict()
+        self.expired_total = 0
+
+    def create(self, session_id, guest_id=None):
+        """Start a guest session (no disk write) and return its guest ID"""
+        with self._lock:
+            guest_id = guest_id or generate_guest_id()
+            while guest_id in self._sessions and self._sessions[guest_id].session_id != session_id:
+                guest_id = generate_guest_id()
+            if guest_id not in self._sessions:
+                self._sessions[guest_id] = _GuestSession(guest_id, session_id, self.history_limit)
+            return guest_id
+
+    def __contains__(self, guest_id):
+        with self._lock:
+            return guest_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def touch(self, guest_id):
+        """Record activity for a guest; returns False if the session has expired"""
+        with self._lock:
+            session = self._sessions.get(guest_id)
+            if session is None:
+                return False
+            session.last_active = time.time()
+            self._sessions.move_to_end(guest_id)
+            return True
+
+    def append(self, guest_id, prompt, response, model, timestamp=None):
+        """Record one chat turn in memory"""
+        with self._lock:
+            session = self._sessions.get(guest_id)
+            if session is None:
+                return
+            session.history.append((session.next_seq, {
+                "timestamp": timestamp or datetime.datetime.now().isoformat(),
+                "prompt": prompt,
+                "response": response,
+                "model": model
+            }))
+            session.next_seq += 1
+            session.last_active = time.time()
+            self._sessions.move_to_end(guest_id)
+
+    def recent(self, guest_id, limit=10):
+        """Return a guest's last 'limit' entries, oldest first"""
+        with self._lock:
+            session = self._sessions.get(guest_id)
+            if session is None:
+                return []
+            return [dict(entry) for _, entry in list(session.history)[-limit:]]
+
+    def page(self, guest_id, before=None, page_size=5):
+        """Return (entries newest first, next_cursor), matching HistoryStore.page"""
+        with self._lock:
+            session = self._sessions.get(guest_id)
+            if session is None:
+                return [], None
+            older = [(seq, entry) for seq, entry in reversed(session.history) if before is None or seq < before]
+        entries = [dict(entry, id=seq) for seq, entry in older[:page_size]]
+        next_cursor = entries[-1]["id"] if len(older) > page_size else None
+        return entries, next_cursor
+
+    def promote(self, guest_id, email, history_store):
+        """Copy a guest's history into durable storage for 'email' and end the guest session"""
+        with self._lock:
+            session = self._sessions.pop(guest_id, None)
+        if session is None:
+            return 0
+        for _, entry in session.history:
+            history_store.append(email, entry["prompt"], entry["response"], entry["model"], entry["timestamp"])
+        return len(session.history)
+
+    def discard(self, guest_id):
+        """End a guest session without keeping its history"""
+        with self._lock:
+            self._sessions.pop(guest_id, None)
+
+    def reap(self, now=None, limit=None):
+        """Expire up to 'limit' sessions idle past the TTL; returns (scanned, removed)
+
+        Sessions are kept in activity order, so the scan stops at the first
+        session that is still live instead of walking every guest.
+        """
+        cutoff = (now or time.time()) - self.ttl
+        scanned = removed = 0
+        with self._lock:
+            while self._sessions and (limit is None or removed < limit):
+                guest_id, session = next(iter(self._sessions.items()))
+                scanned += 1
+                if session.last_active >= cutoff:
+                    break
+                del self._sessions[guest_id]
+                removed += 1
+            self.expired_total += removed
+        return scanned, removed
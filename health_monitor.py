@@ -0,0 +1,106 @@
+"""
+Background API health monitor for LLM-library Chat Test
+Probes the Groq API on a daemon thread so page reruns only read the last
+known status instead of making a network call themselves.
+"""
+
+import time
+import threading
+
+
+class HealthMonitor:
+    """Periodically runs a probe and keeps the latest result in memory
+
+    The probe is a callable returning (ok, message, payload). The payload
+    (the parsed /models response) is kept so model listing can reuse it
+    instead of fetching the same endpoint again; on_payload, if given, is
+    called with each successful payload from the refreshing thread.
+    """
+
+    def __init__(self, probe, interval=60, on_payload=None):
+        self.probe = probe
+        self.interval = interval
+        self.on_payload = on_payload
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checked = threading.Event()
+        self._thread = None
+        self._ok = False
+        self._message = "Checking API status..."
+        self._latency = None
+        self._checked_at = None
+        self._payload = None
+        self._payload_at = None
+
+    def start(self):
+        """Start the background refresh thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="groq-health-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to exit after its current probe"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        """Run the probe now and record its result"""
+        # Serialize probes so a background tick and an on-demand refresh don't both hit the API
+        with self._refresh_lock:
+            start = time.monotonic()
+            try:
+                ok, message, payload = self.probe()
+            except Exception as e:
+                ok, message, payload = False, f"Connection Error: {str(e)[:50]}", None
+            self.record(ok, message, time.monotonic() - start, payload)
+        return ok, message
+
+    def record(self, ok, message, latency, payload=None):
+        """Store a probe result, keeping the last successful payload"""
+        now = time.time()
+        with self._lock:
+            self._ok = ok
+            self._message = message
+            self._latency = latency
+            self._checked_at = now
+            if ok and payload is not None:
+                self._payload = payload
+                self._payload_at = now
+        self._checked.set()
+        if ok and payload is not None and self.on_payload is not None:
+            try:
+                self.on_payload(payload)
+            except Exception:
+                # A failing listener must not stop the monitor
+                pass
+
+    def wait_until_checked(self, timeout=None):
+        """Block until the first probe has finished; returns False on timeout"""
+        return self._checked.wait(timeout)
+
+    def status(self):
+        """Return a snapshot of the last known status without blocking on the network"""
+        with self._lock:
+            age = time.time() - self._checked_at if self._checked_at else None
+            return {
+                "ok": self._ok,
+                "message": self._message,
+                "latency": self._latency,
+                "age": age,
+                "checked": self._checked_at is not None
+            }
+
+    def payload(self, max_age=None):
+        """Return the last successful payload if it is younger than max_age seconds"""
+        with self._lock:
+            if self._payload is None:
+                return None
+            if max_age is not None and time.time() - self._payload_at > max_age:
+                return None
+            return self._payload
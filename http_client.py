@@ -0,0 +1,74 @@
+"""
+Shared HTTP client for LLM-library Chat Test
+A single pooled, keep-alive httpx client used by the Groq SDK and by the
+metadata calls (model list, health probe), so reruns reuse open TLS
+connections instead of paying a fresh handshake on every request.
+"""
+
+import os
+import time
+import random
+import threading
+import httpx
+
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com").rstrip("/")
+
+# Completions on large models can take a while; metadata calls pass a shorter timeout
+DEFAULT_TIMEOUT = httpx.Timeout(float(os.getenv("GROQ_HTTP_TIMEOUT", "60")), connect=5.0)
+METADATA_TIMEOUT = httpx.Timeout(5.0)
+
+POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("GROQ_HTTP_POOL_SIZE", "20")),
+    max_keepalive_connections=int(os.getenv("GROQ_HTTP_POOL_SIZE", "20")),
+    keepalive_expiry=60
+)
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.getenv("GROQ_HTTP_RETRIES", "2"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Return the process-wide pooled HTTP client, creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(timeout=DEFAULT_TIMEOUT, limits=POOL_LIMITS)
+        return _client
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(response):
+    """Parse a numeric Retry-After header, or None if absent/unparseable"""
+    value = response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def request_with_retries(method, url, max_retries=MAX_RETRIES, timeout=METADATA_TIMEOUT, **kwargs):
+    """Send a request on the shared client, retrying transient failures with jittered backoff"""
+    client = get_http_client()
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.request(method, url, timeout=timeout, **kwargs)
+        except httpx.TransportError:
+            # Connect/read timeouts and dropped connections
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return response
+        delay = retry_after_seconds(response)
+        # Honour Retry-After, but never let a metadata call sleep for long
+        time.sleep(min(delay, 10.0) if delay is not None else backoff_delay(attempt))
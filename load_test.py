@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Offline Load Test for LLM-library Chat Test
+Starts the mock Groq API, then drives N concurrent simulated Streamlit
+sessions (via streamlit.testing AppTest) through page load, registration,
+login, chat turns and history paging. Reports throughput, p50/p95/p99
+latency per phase and storage write volume. Needs no network access.
+
+AppTest swaps process-global Streamlit state on every run, so each session
+runs in its own process; all of them share the mock API and the data
+directory, like several server processes would. AppTest also reruns the
+whole script on every interaction, so phase times are full-page reruns.
+
+Usage: python load_test.py --sessions 20 --turns 3 --stream --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+from mock_groq import add_server_arguments, server_from_arguments
+from telemetry import percentile
+
+APP_PATH = str(Path(__file__).resolve().parent / "app_groq_chat.py")
+PHASES = ("page_load", "register", "login", "chat", "history")
+STORAGE_FILES = ("users.json", "chat_history.db", "chat_history.db-wal", "response_cache.db", "model_catalog.json")
+
+
+# Colors for output
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    CYAN = '\033[96m'
+    BOLD = '\033[1m'
+    END = '\033[0m'
+
+
+def log(message, color=Colors.CYAN):
+    print(f"{color}{message}{Colors.END}")
+
+
+def process_write_bytes():
+    """Bytes this process has caused to be written to storage (Linux only)"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def storage_sizes(data_dir):
+    """Current size of each storage file in the data directory"""
+    sizes = {}
+    for name in STORAGE_FILES:
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            sizes[name] = os.path.getsize(path)
+    return sizes
+
+
+class SimulatedSession:
+    """One browser session driven through AppTest, recording per-phase latencies"""
+
+    def __init__(self, index, turns, stream, timeout):
+        self.index = index
+        self.turns = turns
+        self.stream = stream
+        self.timeout = timeout
+        self.results = {"samples": {}, "errors": {}}
+        self.email = f"load{index}@example.com"
+        self.password = f"password-{index}"
+
+    def _timed(self, phase, action):
+        start = time.perf_counter()
+        error = None
+        try:
+            action()
+            if self.app.exception:
+                error = str(self.app.exception[0].value)[:200]
+            elif self.app.error and phase != "register":
+                error = str(self.app.error[0].value)[:200]
+        except Exception as e:
+            error = str(e)[:200]
+        elapsed = time.perf_counter() - start
+        self.results["samples"].setdefault(phase, []).append(elapsed)
+        if error:
+            self.results["errors"].setdefault(phase, []).append(error)
+        return error is None
+
+    def _button(self, label=None, key=None):
+        for button in self.app.button:
+            if (key and button.key == key) or (label and button.label == label):
+                return button
+        return None
+
+    def _click(self, label=None, key=None):
+        button = self._button(label, key)
+        if button is None:
+            raise RuntimeError(f"Button {key or label!r} not on the page")
+        button.click().run(timeout=self.timeout)
+
+    def _register(self):
+        self._click(key="sidebar_signin")
+        self.app.text_input(key="reg_email").input(self.email)
+        self.app.text_input(key="reg_password").input(self.password)
+        self.app.text_input(key="reg_password_confirm").input(self.password)
+        self._click(key="register_btn")
+
+    def _login(self):
+        self.app.text_input(key="login_email").input(self.email)
+        self.app.text_input(key="login_password").input(self.password)
+        self._click(key="login_btn")
+        if self.app.session_state["user_email"] != self.email:
+            raise RuntimeError("Login did not take effect")
+
+    def _chat(self, turn):
+        # Unique prompts so the response cache doesn't answer for the model
+        self.app.text_area[0].input(f"Session {self.index} turn {turn}: summarise the plot of a novel")
+        self._click(label="Send")
+
+    def _history(self):
+        if self._button(key="history_older"):
+            self._click(key="history_older")
+        else:
+            self.app.run(timeout=self.timeout)
+
+    def run(self, start_barrier):
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(APP_PATH, default_timeout=self.timeout)
+        # Interpreter start-up and imports happen before the clock starts
+        start_barrier.wait()
+        if not self._timed("page_load", lambda: self.app.run(timeout=self.timeout)):
+            return
+        self.app.toggle(key="stream_responses").set_value(self.stream)
+        if not self._timed("register", self._register) or not self._timed("login", self._login):
+            return
+        for turn in range(self.turns):
+            self._timed("chat", lambda: self._chat(turn))
+        self._timed("history", self._history)
+
+
+def run_session(index, args, data_dir, start_barrier, results_queue):
+    """Worker process entry point: run one session and report its samples"""
+    os.chdir(data_dir)
+    session = SimulatedSession(index, args.turns, args.stream, args.timeout)
+    written_before = process_write_bytes()
+    try:
+        session.run(start_barrier)
+    except Exception as e:
+        session.results["errors"].setdefault("session", []).append(str(e)[:200])
+    written_after = process_write_bytes()
+    session.results["bytes_written"] = written_after - written_before if written_before is not None else None
+    results_queue.put(session.results)
+
+
+def summarize(results, wall_time, turns_completed):
+    """Throughput and latency percentiles per phase"""
+    phases = {}
+    for phase in PHASES:
+        samples = sorted(results["samples"].get(phase, []))
+        if not samples:
+            continue
+        phases[phase] = {
+            "count": len(samples),
+            "errors": len(results["errors"].get(phase, [])),
+            "mean": sum(samples) / len(samples),
+            "p50": percentile(samples, 0.50),
+            "p95": percentile(samples, 0.95),
+            "p99": percentile(samples, 0.99),
+            "max": samples[-1]
+        }
+    return {
+        "wall_time": wall_time,
+        "chat_turns": turns_completed,
+        "turns_per_second": turns_completed / wall_time if wall_time else 0.0,
+        "phases": phases
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against a mock Groq API")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per session")
+    parser.add_argument("--stream", action="store_true", help="Stream responses instead of waiting for the full reply")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed for one page run")
+    parser.add_argument("--rpm", type=float, default=6000, help="Engine requests per minute per model")
+    parser.add_argument("--json", dest="json_path", help="Also write the results as JSON to this file")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the temporary data directory")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+    # Resolved before switching to the data directory
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    server = server_from_arguments(args).start()
+    data_dir = tempfile.mkdtemp(prefix="chat-load-")
+    # Point the app at the mock and at a fresh data directory before any app module is imported
+    os.environ.update({
+        "GROQ_API_KEY": "gsk_load_test",
+        "GROQ_BASE_URL": server.base_url,
+        "CHAT_HISTORY_DB": os.path.join(data_dir, "chat_history.db"),
+        "MODEL_CATALOG_PATH": os.path.join(data_dir, "model_catalog.json"),
+        "ENGINE_REQUESTS_PER_MINUTE": str(args.rpm),
+    })
+    os.chdir(data_dir)
+
+    log(f"\n{Colors.BOLD}🏋️ Load test: {args.sessions} sessions × {args.turns} turns "
+        f"({'streaming' if args.stream else 'blocking'}) against {server.base_url}{Colors.END}")
+
+    context = multiprocessing.get_context("spawn")
+    # One extra party: the clock starts when every session is ready
+    start_barrier = context.Barrier(args.sessions + 1)
+    results_queue = context.Queue()
+    workers = [
+        context.Process(target=run_session, args=(i, args, data_dir, start_barrier, results_queue), name=f"session-{i}")
+        for i in range(args.sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+
+    results = {"samples": {}, "errors": {}}
+    bytes_written = 0
+    for _ in workers:
+        session_results = results_queue.get()
+        for key in ("samples", "errors"):
+            for phase, values in session_results[key].items():
+                results[key].setdefault(phase, []).extend(values)
+        if session_results["bytes_written"] is None:
+            bytes_written = None
+        elif bytes_written is not None:
+            bytes_written += session_results["bytes_written"]
+    wall_time = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+
+    chat_samples = len(results["samples"].get("chat", []))
+    summary = summarize(results, wall_time, chat_samples - len(results["errors"].get("chat", [])))
+    summary["config"] = {key: value for key, value in vars(args).items() if key != "json_path"}
+    summary["storage"] = {
+        "bytes_written": bytes_written,
+        "file_sizes": storage_sizes(data_dir)
+    }
+    summary["mock_server"] = dict(server.stats)
+    summary["error_samples"] = {phase: errors[:3] for phase, errors in results["errors"].items()}
+    server.stop()
+
+    log(f"\n{'Phase':<10} {'count':>6} {'errors':>6} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8}")
+    for phase, stats in summary["phases"].items():
+        color = Colors.RED if stats["errors"] else Colors.GREEN
+        log(f"{phase:<10} {stats['count']:>6} {stats['errors']:>6} {stats['p50']:>8.3f} {stats['p95']:>8.3f} "
+            f"{stats['p99']:>8.3f} {stats['max']:>8.3f}", color)
+    log(f"\nThroughput: {summary['turns_per_second']:.2f} chat turns/s over {wall_time:.1f} s")
+    if bytes_written is not None:
+        log(f"Storage writes: {bytes_written / 1024:.1f} KiB; files: {summary['storage']['file_sizes']}")
+    for phase, errors in summary["error_samples"].items():
+        log(f"⚠️  {phase}: {errors[0]}", Colors.YELLOW)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        log(f"Results written to {json_path}")
+
+    if not args.keep_data:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
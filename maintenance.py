@@ -0,0 +1,93 @@
+"""
+Scheduled maintenance for LLM-library Chat Test
+One background job per server process that expires guest sessions and old
+chat history by age. Each task does a bounded amount of work per tick and
+reports how many records it scanned and removed.
+"""
+
+import os
+import time
+import threading
+
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "60"))
+# Most records each task may remove per tick, so one tick never stalls the store
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+
+
+class MaintenanceJob:
+    """Runs registered cleanup tasks on a daemon thread and keeps per-task metrics
+
+    A task is a callable taking the batch size and returning
+    (scanned, removed) for the work it did this tick.
+    """
+
+    def __init__(self, interval=MAINTENANCE_INTERVAL, batch_size=MAINTENANCE_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._metrics = {"ticks": 0, "last_tick_at": None, "last_tick_seconds": None, "tasks": {}}
+
+    def add_task(self, name, task):
+        """Register a cleanup task under a metrics name"""
+        self._tasks.append((name, task))
+        self._metrics["tasks"][name] = {
+            "scanned_total": 0,
+            "removed_total": 0,
+            "last_scanned": 0,
+            "last_removed": 0,
+            "errors": 0,
+            "last_error": None
+        }
+
+    def run_once(self):
+        """Run every task once and update the metrics"""
+        start = time.monotonic()
+        for name, task in self._tasks:
+            try:
+                scanned, removed = task(self.batch_size)
+                error = None
+            except Exception as e:
+                scanned, removed, error = 0, 0, str(e)[:200]
+            with self._lock:
+                stats = self._metrics["tasks"][name]
+                stats["last_scanned"] = scanned
+                stats["last_removed"] = removed
+                stats["scanned_total"] += scanned
+                stats["removed_total"] += removed
+                if error:
+                    stats["errors"] += 1
+                    stats["last_error"] = error
+        with self._lock:
+            self._metrics["ticks"] += 1
+            self._metrics["last_tick_at"] = time.time()
+            self._metrics["last_tick_seconds"] = time.monotonic() - start
+        return self.metrics()
+
+    def start(self):
+        """Start the background schedule (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop scheduling further ticks"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def metrics(self):
+        """Return a copy of the job and per-task counters"""
+        with self._lock:
+            return {
+                "ticks": self._metrics["ticks"],
+                "last_tick_at": self._metrics["last_tick_at"],
+                "last_tick_seconds": self._metrics["last_tick_seconds"],
+                "tasks": {name: dict(stats) for name, stats in self._metrics["tasks"].items()}
+            }
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Mock Groq API for LLM-library Chat Test
+A local stand-in for the /openai/v1/models and /openai/v1/chat/completions
+endpoints with configurable latency, streaming speed and error injection,
+so benchmarks run without network access or an API key.
+
+Usage: python mock_groq.py --port 8799 --latency 0.3 --error-rate 0.05
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_MODELS = [
+    {"id": "llama-3.1-8b-instant", "owned_by": "Meta", "context_window": 131072},
+    {"id": "llama-3.3-70b-versatile", "owned_by": "Meta", "context_window": 131072},
+    {"id": "qwen/qwen3-32b", "owned_by": "Alibaba Cloud", "context_window": 131072},
+    {"id": "whisper-large-v3", "owned_by": "OpenAI", "context_window": 448}
+]
+
+
+class MockGroqServer:
+    """Threaded mock API server; start() returns once it is accepting requests
+
+    latency: seconds before the first byte of a completion
+    token_delay: seconds between streamed chunks
+    reply_tokens: approximate length of every reply, in words
+    error_rate: fraction of completions answered with error_status
+    """
+
+    def __init__(self, port=0, latency=0.2, token_delay=0.01, reply_tokens=60,
+                 error_rate=0.0, error_status=503, models=None, seed=None):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.models = models or DEFAULT_MODELS
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"models": 0, "completions": 0, "streams": 0, "errors": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """Value for GROQ_BASE_URL"""
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        """Serve on a daemon thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-groq", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _reply(self, request):
+        prompt = request["messages"][-1]["content"] if request.get("messages") else ""
+        words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+        body = " ".join(words[i % len(words)] for i in range(self.reply_tokens))
+        return f"<think>Answering a {len(prompt)}-character prompt</think>{body}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/openai/v1/models":
+                    self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+                    return
+                server._count("models")
+                data = [dict(model, object="model", active=True, created=0) for model in server.models]
+                self._json(200, {"object": "list", "data": data})
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/openai/v1/chat/completions":
+                    self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(server.latency)
+
+                if server._should_fail():
+                    server._count("errors")
+                    headers = {"retry-after": "1"} if server.error_status == 429 else None
+                    self._json(server.error_status, {
+                        "error": {"message": "Injected failure", "type": "mock_error", "code": "injected"}
+                    }, headers)
+                    return
+
+                model = request.get("model", "")
+                text = server._reply(request)
+                usage = {
+                    "prompt_tokens": sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages", [])),
+                    "completion_tokens": server.reply_tokens,
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                created = int(time.time())
+
+                if not request.get("stream"):
+                    server._count("completions")
+                    self._json(200, {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage
+                    })
+                    return
+
+                server._count("streams")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = text.split(" ")
+                for index, piece in enumerate(pieces):
+                    chunk = {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": piece if index == 0 else " " + piece},
+                            "finish_reason": None
+                        }]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                final = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "x_groq": {"id": "req-mock", "usage": usage}
+                }
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def add_server_arguments(parser):
+    """Register the mock server options on an argparse parser"""
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each completion starts")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between streamed chunks")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="Words per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of completions that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for error injection")
+
+
+def server_from_arguments(args, port=0):
+    """Build a MockGroqServer from parsed add_server_arguments options"""
+    return MockGroqServer(
+        port=port,
+        latency=args.latency,
+        token_delay=args.token_delay,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the Groq API")
+    parser.add_argument("--port", type=int, default=8799)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+    server = server_from_arguments(args, port=args.port).start()
+    print(f"Mock Groq API on {server.base_url} (set GROQ_BASE_URL to this)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
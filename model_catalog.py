@@ -0,0 +1,166 @@
+"""
+Model catalog for LLM-library Chat Test
+Built once per /models refresh: the selectable models already filtered and
+sorted, an id -> position map for the model picker, and per-model metadata
+(context window, owner, active flag) for context budgeting. CatalogStore
+serves the last good catalog while it is revalidated in the background and
+keeps a copy on disk for cold starts.
+"""
+
+import os
+import json
+import fnmatch
+import datetime
+import threading
+
+from chat_store import write_json_atomic
+from context_window import DEFAULT_CONTEXT_WINDOW
+
+# Comma-separated, case-insensitive shell-style patterns matched against model IDs.
+# A model is listed if it matches an include rule (empty = all) and no exclude rule.
+MODEL_INCLUDE = os.getenv("MODEL_INCLUDE", "")
+MODEL_EXCLUDE = os.getenv("MODEL_EXCLUDE", "*whisper*,*distil*,allam*,playai*")
+# Last good /models response, read at startup so a cold start doesn't need the network
+MODEL_CATALOG_PATH = os.getenv("MODEL_CATALOG_PATH", "model_catalog.json")
+
+
+def parse_rules(value):
+    """Split a comma-separated rule string into lower-case patterns"""
+    return [rule.strip().lower() for rule in value.split(",") if rule.strip()]
+
+
+def display_name(model_id):
+    """Readable name for a model ID"""
+    return model_id.replace("-", " ").title()
+
+
+class ModelCatalog:
+    """Immutable snapshot of the models offered in the picker"""
+
+    def __init__(self, models, include=MODEL_INCLUDE, exclude=MODEL_EXCLUDE):
+        """models: iterable of /models entries (dicts with at least an 'id')"""
+        self.include = parse_rules(include)
+        self.exclude = parse_rules(exclude)
+        self.models = {}
+        for model in models:
+            model_id = model.get("id")
+            # Groq marks retired models inactive before removing them
+            if not model_id or model.get("active") is False or not self.allows(model_id):
+                continue
+            self.models[model_id] = {
+                "id": model_id,
+                "name": display_name(model_id),
+                "context_window": model.get("context_window") or DEFAULT_CONTEXT_WINDOW,
+                "owned_by": model.get("owned_by"),
+                "active": model.get("active", True)
+            }
+        self.ids = sorted(self.models)
+        self.positions = {model_id: position for position, model_id in enumerate(self.ids)}
+
+    @classmethod
+    def from_response(cls, models_data, **rules):
+        """Build a catalog from a /openai/v1/models response body"""
+        return cls(models_data.get("data", []), **rules)
+
+    @classmethod
+    def from_names(cls, names, **rules):
+        """Build a catalog from an {id: display name} mapping without metadata"""
+        return cls([{"id": model_id} for model_id in names], **rules)
+
+    def allows(self, model_id):
+        """Whether the include/exclude rules admit a model ID"""
+        model_id = model_id.lower()
+        if self.include and not any(fnmatch.fnmatchcase(model_id, rule) for rule in self.include):
+            return False
+        return not any(fnmatch.fnmatchcase(model_id, rule) for rule in self.exclude)
+
+    def __contains__(self, model_id):
+        return model_id in self.models
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, model_id, default=0):
+        """Position of a model in the sorted list (for a selectbox index)"""
+        return self.positions.get(model_id, default)
+
+    def context_window(self, model_id):
+        """Context window in tokens, or the default for unknown models"""
+        model = self.models.get(model_id)
+        return model["context_window"] if model else DEFAULT_CONTEXT_WINDOW
+
+    def display_names(self):
+        """{id: display name} for the listed models, in sorted order"""
+        return {model_id: self.models[model_id]["name"] for model_id in self.ids}
+
+
+class CatalogStore:
+    """Stale-while-revalidate holder for the current ModelCatalog
+
+    Readers always get the last good catalog immediately. update() is fed
+    each successful /models response by a background refresher and swaps
+    in a new catalog (and rewrites the disk copy) only when the model list
+    actually changed. Until live data arrives the disk copy is served, and
+    the fallback names only if there is no disk copy either.
+    """
+
+    def __init__(self, fallback_names, path=MODEL_CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._models = None
+        self._catalog = ModelCatalog.from_names(fallback_names)
+        self._source = "fallback"
+        self._updated_at = None
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+            catalog = ModelCatalog(saved["data"])
+        except (OSError, ValueError, KeyError, TypeError):
+            # A corrupt or foreign file is ignored; the next refresh rewrites it
+            return
+        if len(catalog):
+            self._models = saved["data"]
+            self._catalog = catalog
+            self._source = "disk"
+            self._updated_at = saved.get("saved_at")
+
+    @property
+    def source(self):
+        """Where the current catalog came from: 'live', 'disk' or 'fallback'"""
+        return self._source
+
+    def current(self):
+        """The last good catalog; never blocks on the network"""
+        return self._catalog
+
+    def update(self, models_data):
+        """Swap in a catalog built from a fresh /models response if the list changed"""
+        models = models_data.get("data", [])
+        with self._lock:
+            if models == self._models:
+                self._source = "live"
+                return False
+            catalog = ModelCatalog(models)
+            # Keep serving the previous list rather than an empty picker
+            if not len(catalog):
+                return False
+            self._models = models
+            self._catalog = catalog
+            self._source = "live"
+            self._updated_at = datetime.datetime.now().isoformat()
+            saved_at = self._updated_at
+        if self.path:
+            try:
+                write_json_atomic(self.path, {"saved_at": saved_at, "data": models})
+            except OSError:
+                pass
+        return True
+
+    def status(self):
+        """Source of the current catalog, its size and when it was last refreshed"""
+        return {"source": self._source, "models": len(self._catalog), "updated_at": self._updated_at}
@@ -0,0 +1,104 @@
+"""
+Password hashing for LLM-library Chat Test
+Salted scrypt hashes (memory-hard, from hashlib) computed on a small,
+bounded worker pool so a burst of logins can't starve chat reruns.
+Legacy unsalted SHA-256 hashes still verify and are flagged for upgrade.
+"""
+
+import os
+import hmac
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt cost parameters; memory use is 128 * n * r * p bytes (16 MiB by default)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# Concurrent hashes, and how many logins may wait for a worker before being turned away
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "2"))
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", "32"))
+AUTH_TIMEOUT = float(os.getenv("AUTH_TIMEOUT", "10"))
+
+
+class AuthBusyError(Exception):
+    """Raised when the hashing pool is saturated"""
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=256 * n * r * p,
+        dklen=KEY_BYTES
+    )
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Hash password with salted scrypt, returning 'scrypt$n$r$p$salt$key'"""
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${salt.hex()}${key.hex()}"
+
+
+def verify_password(password, stored_hash):
+    """Check password against a scrypt or legacy SHA-256 hash in constant time"""
+    if not stored_hash:
+        return False
+    if stored_hash.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, key = stored_hash.split("$")
+            candidate = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(candidate.hex(), key)
+    # Legacy unsalted single-pass SHA-256
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+
+
+def needs_rehash(stored_hash):
+    """Whether a stored hash is legacy SHA-256 or uses outdated scrypt costs"""
+    return not stored_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+class HashingPool:
+    """Bounded thread pool for password hashing
+
+    hashlib.scrypt releases the GIL, so hashing runs in parallel with
+    Streamlit script threads while at most AUTH_WORKERS cores are used.
+    Callers beyond AUTH_MAX_PENDING get AuthBusyError instead of queueing.
+    """
+
+    def __init__(self, workers=AUTH_WORKERS, max_pending=AUTH_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def run(self, fn, *args, timeout=AUTH_TIMEOUT):
+        """Run fn(*args) on the pool and wait for its result"""
+        if not self._slots.acquire(timeout=timeout):
+            raise AuthBusyError("Too many sign-in attempts right now - please try again shortly")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot frees when the hash finishes, even if this caller stops waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise AuthBusyError("Sign-in is taking too long right now - please try again shortly")
+
+    def hash_password(self, password):
+        """Hash a password on the pool"""
+        return self.run(hash_password, password)
+
+    def verify_password(self, password, stored_hash):
+        """Verify a password on the pool"""
+        return self.run(verify_password, password, stored_hash)
@@ -0,0 +1,122 @@
+"""
+Assistant output rendering for LLM-library Chat Test
+Turns raw model output into Markdown/HTML for st.markdown in a single pass
+with precompiled patterns: <think> sections become collapsible blocks,
+code fences and inline code pass through untouched, and everything else
+is HTML-escaped because model output is untrusted. Final renders are
+memoized by message hash so reruns don't repeat the regex work.
+"""
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+RENDER_CACHE_SIZE = 256
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# One alternation so the text is scanned once, in order
+_TOKENS = re.compile(
+    r"(?P<fence>^[ \t]*(?P<marker>```|~~~)[^\n]*$)"
+    r"|(?P<code>`[^`\n]+`)"
+    r"|(?P<open><think>)"
+    r"|(?P<close></think>)",
+    re.MULTILINE
+)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def escape_html(text):
+    """Neutralize HTML in untrusted text while leaving Markdown syntax (e.g. '>' quotes) intact"""
+    return text.replace("&", "&amp;").replace("<", "&lt;")
+
+
+def _thinking_block(content, finished):
+    """Collapsible block for a model's thoughts; left open while still streaming"""
+    if finished:
+        summary = "<details><summary><em>Model's thoughts</em></summary>"
+    else:
+        summary = "<details open><summary><em>Model is thinking...</em></summary>"
+    # Blank lines let Markdown inside the HTML block render
+    return f"{summary}\n\n{content.strip()}\n\n</details>\n\n"
+
+
+def _strip_partial_tag(text):
+    """Hold back a half-received tag such as '<thi' at the end of a streaming buffer"""
+    for tag in (THINK_OPEN, THINK_CLOSE):
+        for length in range(len(tag) - 1, 0, -1):
+            if text.endswith(tag[:length]):
+                return text[:-length]
+    return text
+
+
+def _render(text, streaming):
+    if streaming:
+        text = _strip_partial_tag(text)
+
+    output = []
+    thinking = None  # collects the current <think> section while open
+    fence = None     # marker of the open code fence, if any
+    position = 0
+
+    def emit(chunk):
+        (thinking if thinking is not None else output).append(chunk)
+
+    for match in _TOKENS.finditer(text):
+        start, end = match.span()
+        if start > position:
+            between = text[position:start]
+            emit(between if fence else escape_html(between))
+        token = match.group(0)
+
+        if fence:
+            # Inside a code block only the matching closing fence is special
+            if match.group("fence") and token.strip() == fence:
+                fence = None
+            emit(token)
+        elif match.group("fence"):
+            fence = match.group("marker")
+            emit(token)
+        elif match.group("code"):
+            emit(token)
+        elif match.group("open") and thinking is None:
+            thinking = []
+        elif match.group("close") and thinking is not None:
+            output.append(_thinking_block("".join(thinking), finished=True))
+            thinking = None
+        else:
+            # Stray or nested tag: show it as text
+            emit(escape_html(token))
+        position = end
+
+    if position < len(text):
+        emit(text[position:] if fence else escape_html(text[position:]))
+    if thinking is not None:
+        output.append(_thinking_block("".join(thinking), finished=False))
+    return "".join(output)
+
+
+def render_assistant_output(text, streaming=False):
+    """Render model output for st.markdown(..., unsafe_allow_html=True)
+
+    With streaming=True the text may be a partial buffer; partial renders
+    are not cached since each one is seen only once.
+    """
+    if streaming:
+        return _render(text, streaming=True)
+
+    key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    rendered = _render(text, streaming=False)
+    with _cache_lock:
+        _cache[key] = rendered
+        while len(_cache) > RENDER_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rendered
@@ -0,0 +1,461 @@
+"""
+Shared completion request engine for LLM-library Chat Test
+All sessions submit chat completions to one asyncio event loop running on
+a background thread. The engine enforces a global and a per-model
+concurrency limit, a per-model token-bucket rate limiter that follows
+Groq's rate-limit headers, and round-robin scheduling between sessions so
+one busy session can't starve the others. Transient failures are retried
+with backoff, and a model that stays overloaded or has been retired fails
+over to its designated fallback model.
+"""
+
+import os
+import re
+import time
+import queue
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque, OrderedDict
+
+import httpx
+from groq import AsyncGroq, APIConnectionError, APIStatusError
+
+from http_client import DEFAULT_TIMEOUT, POOL_LIMITS, RETRY_STATUSES, backoff_delay
+
+ENGINE_MAX_CONCURRENCY = int(os.getenv("ENGINE_MAX_CONCURRENCY", "16"))
+ENGINE_PER_MODEL_CONCURRENCY = int(os.getenv("ENGINE_PER_MODEL_CONCURRENCY", "4"))
+# Requests per minute allowed per model before the engine starts queueing
+ENGINE_REQUESTS_PER_MINUTE = float(os.getenv("ENGINE_REQUESTS_PER_MINUTE", "30"))
+# Longest a caller waits (queue + generation) before giving up
+ENGINE_REQUEST_TIMEOUT = float(os.getenv("ENGINE_REQUEST_TIMEOUT", "120"))
+# Retries per model on 429/5xx and dropped connections (replaces the SDK's own retries)
+ENGINE_MAX_RETRIES = int(os.getenv("ENGINE_MAX_RETRIES", "2"))
+# Comma-separated primary=fallback pairs used when a model is overloaded or retired
+MODEL_FALLBACKS = os.getenv(
+    "MODEL_FALLBACKS",
+    "llama-3.3-70b-versatile=llama-3.1-8b-instant,"
+    "openai/gpt-oss-120b=openai/gpt-oss-20b,"
+    "meta-llama/llama-4-maverick-17b-128e-instruct=meta-llama/llama-4-scout-17b-16e-instruct"
+)
+# A rate limit that resets later than this fails over instead of waiting it out
+MAX_RETRY_WAIT = 10.0
+
+# Error codes Groq returns for models that no longer exist
+_MODEL_GONE_CODES = {"model_decommissioned", "model_not_found"}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+_STREAM_END = object()
+
+
+class EngineBusyError(Exception):
+    """Raised when a request waited longer than the engine timeout"""
+
+
+def parse_reset_duration(value):
+    """Parse Groq reset durations such as '7.66s', '2m59.56s' or '250ms' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_fallbacks(value):
+    """Parse 'primary=fallback,...' into a {primary: fallback} map"""
+    fallbacks = {}
+    for pair in value.split(","):
+        primary, _, fallback = pair.partition("=")
+        if primary.strip() and fallback.strip():
+            fallbacks[primary.strip()] = fallback.strip()
+    return fallbacks
+
+
+def is_transient(error):
+    """Whether a completion error is worth retrying on the same model"""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in RETRY_STATUSES
+
+
+def is_model_gone(error):
+    """Whether a completion error says the model is retired or unknown"""
+    if not isinstance(error, APIStatusError) or error.status_code not in (400, 404):
+        return False
+    body = error.body if isinstance(error.body, dict) else {}
+    details = body.get("error", body)
+    code = details.get("code") if isinstance(details, dict) else None
+    return code in _MODEL_GONE_CODES or error.status_code == 404
+
+
+def retry_wait(error):
+    """Seconds the server asked us to wait before retrying, if it said"""
+    if isinstance(error, APIStatusError):
+        return parse_reset_duration(error.response.headers.get("retry-after"))
+    return None
+
+
+class TokenBucket:
+    """Async token bucket that can be paused until a server-reported reset time"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Hold back all requests for the given number of seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Respect retry-after and exhausted x-ratelimit-* budgets reported by Groq"""
+        retry_after = parse_reset_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            self.pause(retry_after)
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            try:
+                exhausted = remaining is not None and float(remaining) <= 0
+            except ValueError:
+                exhausted = False
+            if exhausted and reset is not None:
+                self.pause(reset)
+
+
+class _Job:
+    """One queued completion request"""
+
+    def __init__(self, session_id, model, params, stream, failover):
+        self.session_id = session_id
+        self.model = model
+        self.params = params
+        self.failover = failover
+        # Model that produced the reply, which differs from 'model' after a failover
+        self.served_model = None
+        self.attempts = 0
+        self.future = concurrent.futures.Future()
+        # Streaming jobs hand chunks to the caller's thread through this queue
+        self.chunks = queue.Queue() if stream else None
+        # Callbacks run (on the engine thread) after each chunk, to wake async consumers
+        self.listeners = []
+        self.delivered = False
+        self.cancelled = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        # Token usage reported by the API, when it sends it
+        self.usage = None
+
+    @property
+    def latency(self):
+        """Seconds from submission to completion (includes queueing)"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+    def timings(self):
+        """Seconds spent queueing, until the first token and inside the API, where known"""
+        timings = {}
+        if self.started_at is not None:
+            timings["queue"] = self.started_at - self.submitted_at
+        if self.first_token_at is not None:
+            timings["first_token"] = self.first_token_at - self.submitted_at
+        if self.started_at is not None and self.finished_at is not None:
+            timings["api"] = self.finished_at - self.started_at
+        return timings
+
+    def put_chunk(self, item):
+        """Hand a delta, an error or the end marker to the consumer"""
+        self.chunks.put(item)
+        for listener in list(self.listeners):
+            listener()
+
+
+class RequestEngine:
+    """Process-wide asyncio engine that all sessions submit completions to"""
+
+    def __init__(self, api_key, max_concurrency=ENGINE_MAX_CONCURRENCY,
+                 per_model_concurrency=ENGINE_PER_MODEL_CONCURRENCY,
+                 requests_per_minute=ENGINE_REQUESTS_PER_MINUTE, base_url=None,
+                 max_retries=ENGINE_MAX_RETRIES, fallbacks=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.fallbacks = parse_fallbacks(MODEL_FALLBACKS) if fallbacks is None else fallbacks
+        self.max_concurrency = max_concurrency
+        self.per_model_concurrency = per_model_concurrency
+        self.requests_per_minute = requests_per_minute
+
+        # session_id -> deque of jobs; dict order is the round-robin order
+        self._queues = OrderedDict()
+        self._queue_lock = threading.Lock()
+        self._model_semaphores = {}
+        self._buckets = {}
+        self._active = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="groq-request-engine", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        # Loop-bound primitives must be created on the engine thread
+        self._client = AsyncGroq(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            # Retries are the engine's job so they respect its rate limits and failover
+            max_retries=0,
+            http_client=httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=POOL_LIMITS)
+        )
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._work_available = asyncio.Event()
+        self._loop.create_task(self._dispatch())
+        self._ready.set()
+        self._loop.run_forever()
+
+    # --- Submission (called from Streamlit script threads) ---
+
+    def submit(self, session_id, model, messages, stream=False, failover=True, **params):
+        """Queue a completion and return its job; use wait()/iter_stream() for blocking access
+
+        With failover=False the job never switches to a fallback model.
+        """
+        job = _Job(session_id, model, dict(params, messages=messages), stream, failover)
+        with self._queue_lock:
+            self._queues.setdefault(session_id, deque()).append(job)
+        self._loop.call_soon_threadsafe(self._work_available.set)
+        return job
+
+    def wait(self, job, timeout=ENGINE_REQUEST_TIMEOUT):
+        """Block until a submitted job's ChatCompletion is available"""
+        try:
+            return job.future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            job.cancelled.set()
+            raise EngineBusyError("The model is busy right now - please try again in a moment")
+
+    def iter_stream(self, job, timeout=ENGINE_REQUEST_TIMEOUT):
+        """Yield text deltas of a submitted streaming job as they arrive"""
+        try:
+            while True:
+                try:
+                    item = job.chunks.get(timeout=timeout)
+                except queue.Empty:
+                    raise EngineBusyError("The model is busy right now - please try again in a moment")
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Stop generation if the caller stopped reading early
+            job.cancelled.set()
+
+    async def aresult(self, job, timeout=ENGINE_REQUEST_TIMEOUT):
+        """Async wait() for callers on another event loop; no thread is held while waiting"""
+        try:
+            # Shielded so a timeout doesn't cancel the future the engine still has to resolve
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+        except asyncio.TimeoutError:
+            job.cancelled.set()
+            raise EngineBusyError("The model is busy right now - please try again in a moment")
+
+    async def aiter_stream(self, job, timeout=ENGINE_REQUEST_TIMEOUT):
+        """Async iter_stream() for callers on another event loop; no thread is held while waiting"""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        listener = lambda: loop.call_soon_threadsafe(wakeup.set)
+        job.listeners.append(listener)
+        try:
+            while True:
+                try:
+                    item = job.chunks.get_nowait()
+                except queue.Empty:
+                    # Cleared before the next wait, so a chunk put after the check still wakes us
+                    wakeup.clear()
+                    if job.chunks.empty():
+                        try:
+                            await asyncio.wait_for(wakeup.wait(), timeout)
+                        except asyncio.TimeoutError:
+                            raise EngineBusyError("The model is busy right now - please try again in a moment")
+                    continue
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            job.listeners.remove(listener)
+            # Stop generation if the caller stopped reading early
+            job.cancelled.set()
+
+    def complete(self, session_id, model, messages, timeout=ENGINE_REQUEST_TIMEOUT, **params):
+        """Submit a completion and block until the ChatCompletion is available"""
+        return self.wait(self.submit(session_id, model, messages, **params), timeout)
+
+    def stream(self, session_id, model, messages, timeout=ENGINE_REQUEST_TIMEOUT, **params):
+        """Submit a streaming completion and yield text deltas as they arrive"""
+        return self.iter_stream(self.submit(session_id, model, messages, stream=True, **params), timeout)
+
+    def stats(self):
+        """Queued and in-flight request counts"""
+        with self._queue_lock:
+            queued = sum(len(jobs) for jobs in self._queues.values())
+        return {"queued": queued, "active": dict(self._active)}
+
+    # --- Engine loop ---
+
+    def _next_job(self):
+        """Pop the next job, rotating between sessions for fairness"""
+        with self._queue_lock:
+            while self._queues:
+                session_id, jobs = next(iter(self._queues.items()))
+                job = jobs.popleft()
+                # Move this session to the back of the rotation
+                del self._queues[session_id]
+                if jobs:
+                    self._queues[session_id] = jobs
+                if not job.cancelled.is_set():
+                    return job
+            return None
+
+    async def _dispatch(self):
+        while True:
+            await self._work_available.wait()
+            await self._global_semaphore.acquire()
+            job = self._next_job()
+            if job is None:
+                self._global_semaphore.release()
+                self._work_available.clear()
+                # Re-check: a submit may have raced with the clear
+                with self._queue_lock:
+                    if self._queues:
+                        self._work_available.set()
+                continue
+            self._loop.create_task(self._execute(job))
+
+    def _model_limits(self, model):
+        if model not in self._model_semaphores:
+            self._model_semaphores[model] = asyncio.Semaphore(self.per_model_concurrency)
+            self._buckets[model] = TokenBucket(self.requests_per_minute)
+        return self._model_semaphores[model], self._buckets[model]
+
+    async def _execute(self, job):
+        model = job.model
+        tried = set()
+        retries = 0
+        try:
+            while not job.cancelled.is_set():
+                try:
+                    await self._attempt(job, model)
+                    return
+                except (APIStatusError, APIConnectionError) as e:
+                    # Part of a reply already reached the user: no silent restart
+                    if job.delivered:
+                        raise
+                    wait = retry_wait(e)
+                    if is_transient(e) and retries < self.max_retries and (wait or 0) <= MAX_RETRY_WAIT:
+                        retries += 1
+                        # A 429 has already paused the model's bucket for its retry-after
+                        await asyncio.sleep(backoff_delay(retries - 1))
+                        continue
+                    fallback = self.fallbacks.get(model) if job.failover else None
+                    tried.add(model)
+                    if fallback and fallback not in tried and (is_transient(e) or is_model_gone(e)):
+                        model, retries = fallback, 0
+                        continue
+                    raise
+        except BaseException as e:
+            job.finished_at = time.monotonic()
+            if job.chunks is not None:
+                job.put_chunk(e)
+            elif not job.future.done():
+                job.future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self._global_semaphore.release()
+
+    async def _attempt(self, job, model):
+        """One request to one model under its concurrency and rate limits"""
+        semaphore, bucket = self._model_limits(model)
+        async with semaphore:
+            await bucket.acquire()
+            if job.cancelled.is_set():
+                return
+            job.attempts += 1
+            job.started_at = job.started_at or time.monotonic()
+            self._active[model] = self._active.get(model, 0) + 1
+            try:
+                await self._call(job, model, bucket)
+            except APIStatusError as e:
+                bucket.update_from_headers(e.response.headers)
+                raise
+            finally:
+                self._active[model] -= 1
+
+    async def _call(self, job, model, bucket):
+        raw = await self._client.chat.completions.with_raw_response.create(
+            model=model,
+            stream=job.chunks is not None,
+            **job.params
+        )
+        bucket.update_from_headers(raw.headers)
+        result = await raw.parse()
+        job.served_model = model
+
+        if job.chunks is None:
+            job.finished_at = time.monotonic()
+            job.usage = result.usage
+            job.future.set_result(result)
+            return
+
+        try:
+            async for chunk in result:
+                if job.cancelled.is_set():
+                    break
+                # Groq reports usage on the final chunk under x_groq
+                usage = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+                if usage is not None:
+                    job.usage = usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not job.delivered:
+                        job.first_token_at = time.monotonic()
+                    job.delivered = True
+                    job.put_chunk(delta)
+        finally:
+            await result.close()
+        job.finished_at = time.monotonic()
+        job.put_chunk(_STREAM_END)
+        job.future.set_result(None)
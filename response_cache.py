@@ -0,0 +1,134 @@
+"""
+Response cache for LLM-library Chat Test
+Exact-match cache of completions keyed on the model plus a hash of the
+normalized conversation, with LRU + TTL eviction, a size cap in bytes and
+optional persistence to a SQLite file.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from chat_store import connect
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Empty path keeps the cache in memory only
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+
+_WHITESPACE = re.compile(r"\s+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    value TEXT NOT NULL
+);
+"""
+
+
+def normalize_content(content):
+    """Collapse whitespace so trivially different prompts share a cache entry"""
+    return _WHITESPACE.sub(" ", content or "").strip()
+
+
+def cache_key(model, messages, temperature=None):
+    """Stable hash of (model, temperature, normalized role/content conversation)"""
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [[message["role"], normalize_content(message["content"])] for message in messages]
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry TTL and a total size cap in bytes"""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL, path=RESPONSE_CACHE_PATH):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        # key -> (created_at, value); insertion order is recency order
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        if path:
+            self._conn = connect(path)
+            self._conn.executescript(SCHEMA)
+            self._load()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def _load(self):
+        """Warm the in-memory LRU from disk, oldest first, dropping expired rows"""
+        cutoff = time.time() - self.ttl
+        self._conn.execute("DELETE FROM response_cache WHERE created_at < ?", (cutoff,))
+        rows = self._conn.execute(
+            "SELECT key, created_at, value FROM response_cache ORDER BY created_at"
+        ).fetchall()
+        for row in rows:
+            self._insert(row["key"], row["created_at"], row["value"])
+        self._evict()
+
+    def _insert(self, key, created_at, value):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key)[1].encode("utf-8"))
+        self._entries[key] = (created_at, value)
+        self._bytes += len(value.encode("utf-8"))
+
+    def _remove(self, key):
+        created_at, value = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss or expiry"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Store a response, evicting least recently used entries past the size cap"""
+        if not self.enabled or len(value.encode("utf-8")) > self.max_bytes:
+            return
+        created_at = time.time()
+        with self._lock:
+            self._insert(key, created_at, value)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, created_at, value) VALUES (?, ?, ?)",
+                    (key, created_at, value)
+                )
+            self._evict()
+
+    def stats(self):
+        """Entry count, size and hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Storage Benchmark for LLM-library Chat Test
+Generates synthetic legacy users.json datasets (users x history entries per
+user), imports them into the SQLite store the way a first start does, then
+times the ChatService calls behind load_user_data, authenticate_user,
+get_user_history, save_user_prompt and cleanup_guest_users. Each operation
+reports wall time percentiles, peak RSS and bytes written; results are JSON
+so runs on different commits can be compared with --baseline.
+
+Each dataset runs in its own process so peak RSS is not inflated by the
+previous one.
+
+Usage: python storage_benchmark.py --users 1000,100000 --history 0,10,100 --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+from chat_service import ChatService
+from maintenance import MAINTENANCE_BATCH_SIZE
+from passwords import hash_password
+from telemetry import percentile
+
+# Cases with more history entries than this are skipped (users.json is loaded whole)
+DEFAULT_MAX_ENTRIES = 2_000_000
+# p50 slowdown against a baseline that counts as a regression, ignoring
+# differences below timer noise for the microsecond-scale lookups
+REGRESSION_THRESHOLD = 1.25
+REGRESSION_MIN_DELTA = 50e-6
+
+PASSWORD = "benchmark-password"
+
+
+# Colors for output
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    CYAN = '\033[96m'
+    BOLD = '\033[1m'
+    END = '\033[0m'
+
+
+def log(message, color=Colors.CYAN):
+    print(f"{color}{message}{Colors.END}")
+
+
+def parse_sizes(value):
+    """Parse '1k,10k,1m' style comma-separated counts"""
+    sizes = []
+    for item in value.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        multiplier = {"k": 1_000, "m": 1_000_000}.get(item[-1], 1)
+        sizes.append(int(float(item.rstrip("km")) * multiplier))
+    return sizes
+
+
+def io_counters():
+    """Bytes written to storage and bytes passed to write() by this process (Linux only)"""
+    counters = {}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                counters[name] = int(value)
+    except OSError:
+        return None
+    return {"bytes_written": counters.get("write_bytes", 0), "bytes_write_calls": counters.get("wchar", 0)}
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS mark for this process; False where unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is KiB on Linux and bytes on macOS; it never resets
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def write_users_json(path, users, history, guest_fraction, seed):
+    """Stream a synthetic legacy users.json to disk; returns (emails, guest count)"""
+    rng = random.Random(seed)
+    # One shared hash: hashing a million passwords would dominate generation time
+    password_hash = hash_password(PASSWORD)
+    old = (datetime.datetime.now() - datetime.timedelta(days=30)).isoformat()
+    emails = []
+    guests = 0
+    with open(path, "w") as f:
+        f.write("{")
+        for index in range(users):
+            is_guest = rng.random() < guest_fraction
+            email = f"Guest_{index:08d}" if is_guest else f"user{index}@example.com"
+            guests += is_guest
+            if not is_guest:
+                emails.append(email)
+            record = {
+                "password": "" if is_guest else password_hash,
+                "created_at": old,
+                "is_guest": is_guest,
+                "guest_session_id": f"session{index}" if is_guest else "",
+                "chat_history": [
+                    {
+                        "timestamp": old,
+                        "prompt": f"Question {turn} from {email}",
+                        "response": "lorem ipsum dolor sit amet " * 8,
+                        "model": "llama-3.1-8b-instant"
+                    }
+                    for turn in range(history)
+                ]
+            }
+            f.write(("," if index else "") + json.dumps(email) + ":" + json.dumps(record))
+        f.write("}")
+    return emails, guests
+
+
+class Measurement:
+    """Collects per-call wall times plus peak RSS and I/O across a block of calls"""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+
+    def __enter__(self):
+        self.rss_reset = reset_peak_rss()
+        self.io_before = io_counters()
+        return self
+
+    def call(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.samples.append(time.perf_counter() - start)
+        return result
+
+    def __exit__(self, exc_type, exc, tb):
+        io_after = io_counters()
+        samples = sorted(self.samples)
+        self.result = {
+            "calls": len(samples),
+            "total": sum(samples),
+            "mean": sum(samples) / len(samples) if samples else None,
+            "p50": percentile(samples, 0.50),
+            "p95": percentile(samples, 0.95),
+            "max": samples[-1] if samples else None,
+            "peak_rss": peak_rss(),
+            # Without a reset the peak covers everything the process did so far
+            "peak_rss_scope": "operation" if self.rss_reset else "process"
+        }
+        if self.io_before and io_after:
+            for key in io_after:
+                self.result[key] = io_after[key] - self.io_before[key]
+        return False
+
+
+def run_case(users, history, data_dir, samples=200, auth_samples=10, guest_fraction=0.1, seed=0):
+    """Build one dataset in data_dir and time every storage operation on it"""
+    rng = random.Random(seed)
+    users_path = os.path.join(data_dir, "users.json")
+    db_path = os.path.join(data_dir, "chat_history.db")
+
+    start = time.perf_counter()
+    emails, guests = write_users_json(users_path, users, history, guest_fraction, seed)
+    case = {
+        "users": users,
+        "history": history,
+        "guests": guests,
+        "generate_seconds": time.perf_counter() - start,
+        "users_json_bytes": os.path.getsize(users_path),
+        "operations": {}
+    }
+    operations = case["operations"]
+
+    # The same ChatService the app runs on, pointed at this dataset
+    service = ChatService(history_path=db_path, users_json_path=users_path)
+
+    # First start: the store migrates history, then accounts, out of users.json
+    with Measurement("import_users_json") as m:
+        m.call(lambda: service.users)
+    operations[m.name] = m.result
+
+    # load_user_data: full snapshot read (the service caches it until a user record changes,
+    # so the read behind it is timed directly)
+    with Measurement("load_user_data") as m:
+        for _ in range(3):
+            m.call(service.users.all)
+    operations[m.name] = m.result
+
+    # authenticate_user: keyed lookup plus one scrypt verification on the hashing pool
+    if emails:
+        with Measurement("authenticate_user") as m:
+            for _ in range(auth_samples):
+                m.call(service.authenticate, rng.choice(emails), PASSWORD)
+        operations[m.name] = m.result
+
+    # get_user_history: last 10 turns of a random registered user
+    if emails:
+        with Measurement("get_user_history") as m:
+            for _ in range(samples):
+                m.call(service.history, rng.choice(emails), 10)
+        operations[m.name] = m.result
+
+    # save_user_prompt: existence check plus one appended turn
+    if emails:
+        with Measurement("save_user_prompt") as m:
+            for _ in range(samples):
+                m.call(service.save_prompt, rng.choice(emails), "Benchmark prompt", "Benchmark response",
+                       "llama-3.1-8b-instant")
+        operations[m.name] = m.result
+
+    # cleanup_guest_users: bounded maintenance passes until every stored guest is gone
+    with Measurement("cleanup_guest_users") as m:
+        removed = None
+        while removed != 0:
+            _, removed = m.call(service.cleanup_guest_users, MAINTENANCE_BATCH_SIZE)
+    operations[m.name] = m.result
+    operations[m.name]["removed"] = guests
+
+    case["db_bytes"] = sum(
+        os.path.getsize(db_path + suffix) for suffix in ("", "-wal") if os.path.exists(db_path + suffix)
+    )
+    service.close()
+    return case
+
+
+def _case_worker(users, history, args, results_queue):
+    """Worker process entry point: run one case in a scratch directory"""
+    data_dir = tempfile.mkdtemp(prefix="chat-bench-", dir=args.data_dir)
+    try:
+        case = run_case(users, history, data_dir, args.samples, args.auth_samples, args.guest_fraction, args.seed)
+    except Exception as e:
+        case = {"users": users, "history": history, "error": str(e)[:200]}
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    results_queue.put(case)
+
+
+def git_commit():
+    """Current commit of the working tree, if this is a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, min_delta=REGRESSION_MIN_DELTA):
+    """p50 ratios (current / baseline) per case and operation; returns the regressions"""
+    previous = {(case["users"], case["history"]): case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        before = previous.get((case["users"], case["history"]))
+        if not before or "operations" not in case or "operations" not in before:
+            continue
+        for name, stats in case["operations"].items():
+            old = before["operations"].get(name)
+            if not old or not old.get("p50") or stats.get("p50") is None:
+                continue
+            ratio = stats["p50"] / old["p50"]
+            stats["baseline_ratio"] = round(ratio, 3)
+            if ratio > threshold and stats["p50"] - old["p50"] > min_delta:
+                regressions.append({"users": case["users"], "history": case["history"], "operation": name, "ratio": ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the user and chat history storage layer")
+    parser.add_argument("--users", default="1k,10k,100k", help="Comma-separated user counts (k/m suffixes allowed)")
+    parser.add_argument("--history", default="0,10,100", help="Comma-separated history entries per user")
+    parser.add_argument("--samples", type=int, default=200, help="Calls per cheap operation")
+    parser.add_argument("--auth-samples", type=int, default=10, help="Calls to authenticate_user (each runs scrypt)")
+    parser.add_argument("--guest-fraction", type=float, default=0.1, help="Share of stored users that are expired guests")
+    parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES, help="Skip cases with more history entries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=None, help="Where to build datasets (default: system temp)")
+    parser.add_argument("--json", dest="json_path", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --json output to compare against")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("json_path", "baseline")}
+        },
+        "cases": []
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for users in parse_sizes(args.users):
+        for history in parse_sizes(args.history):
+            if users * history > args.max_entries:
+                log(f"Skipping {users:,} users × {history:,} entries (over --max-entries)", Colors.YELLOW)
+                results["cases"].append({"users": users, "history": history, "skipped": "max_entries"})
+                continue
+            log(f"\n{Colors.BOLD}💾 {users:,} users × {history:,} history entries{Colors.END}")
+            results_queue = context.Queue()
+            worker = context.Process(target=_case_worker, args=(users, history, args, results_queue))
+            worker.start()
+            case = results_queue.get()
+            worker.join()
+            results["cases"].append(case)
+            if "error" in case:
+                log(f"❌ {case['error']}", Colors.RED)
+                continue
+            for name, stats in case["operations"].items():
+                written = stats.get("bytes_write_calls")
+                log(f"  {name:<20} {stats['calls']:>4} calls  p50 {stats['p50'] * 1000:>9.2f} ms  "
+                    f"total {stats['total'] * 1000:>9.1f} ms  "
+                    f"peak RSS {stats['peak_rss'] / 2 ** 20:>7.1f} MiB"
+                    + (f"  written {written / 1024:>9.1f} KiB" if written is not None else ""))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        results["regressions"] = regressions
+        for regression in regressions:
+            log(f"⚠️  {regression['operation']} at {regression['users']:,} × {regression['history']:,}: "
+                f"{regression['ratio']:.2f}× slower than baseline", Colors.YELLOW)
+        if not regressions:
+            log("✅ No regressions against the baseline", Colors.GREEN)
+        status = 1 if regressions else 0
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        log(f"Results written to {args.json_path}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
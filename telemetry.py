@@ -0,0 +1,295 @@
+"""
+Request instrumentation for LLM-library Chat Test
+Timing spans with per-phase breakdowns and token usage for chat turns,
+storage calls and metadata calls. Spans feed Prometheus-style histograms
+and counters (served on METRICS_PORT when set) and, optionally, a JSONL
+trace log with one line per span.
+"""
+
+import os
+import json
+import math
+import time
+import threading
+import functools
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# One JSON line per finished span (unset = no trace file)
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+# Port for a /metrics endpoint in Prometheus text format (0 = disabled)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent durations kept per (span, model) for in-process percentiles
+QUANTILE_WINDOW = 1000
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def _usage_counts(usage):
+    """Prompt/completion token counts from an SDK usage object or a dict"""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return {kind: int(usage.get(f"{kind}_tokens") or 0) for kind in ("prompt", "completion")}
+    return {kind: int(getattr(usage, f"{kind}_tokens", 0) or 0) for kind in ("prompt", "completion")}
+
+
+class _Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+
+
+class Span:
+    """One timed operation; use as a context manager or call finish()
+
+    phase() records named sub-timings (queueing, time to first token,
+    persistence, rendering...) and usage() attaches token counts.
+    """
+
+    def __init__(self, telemetry, name, attrs):
+        self.telemetry = telemetry
+        self.name = name
+        self.attrs = attrs
+        self.phases = {}
+        self.tokens = None
+        self.ok = True
+        self.error = None
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        """Add or update span attributes (e.g. the model that served a turn)"""
+        self.attrs.update(attrs)
+
+    def phase(self, name, seconds):
+        """Record the duration of one phase of this span"""
+        if seconds is not None:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def measure(self, name):
+        """Context manager timing a phase of this span"""
+        return _PhaseTimer(self, name)
+
+    def usage(self, usage):
+        """Attach token usage from an SDK usage object or dict"""
+        self.tokens = _usage_counts(usage)
+
+    def fail(self, error):
+        """Mark the span as failed"""
+        self.ok = False
+        self.error = str(error)[:200]
+
+    def finish(self):
+        """End the span and record it (only the first call counts)"""
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self.telemetry.record(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Streamlit's rerun/stop signals are BaseExceptions, not failures
+        if exc is not None and isinstance(exc, Exception):
+            self.fail(exc)
+        self.finish()
+        return False
+
+
+class _PhaseTimer:
+    def __init__(self, span, name):
+        self.span = span
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.phase(self.name, time.perf_counter() - self._start)
+        return False
+
+
+class Telemetry:
+    """Process-wide span aggregation and export"""
+
+    def __init__(self, trace_path=TRACE_LOG_PATH):
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._trace_file = None
+        self._spans = {}      # (span, model) -> _Histogram
+        self._phases = {}     # (span, phase, model) -> _Histogram
+        self._errors = {}     # (span, model) -> count
+        self._tokens = {}     # (model, kind) -> count
+        self._recent = {}     # (span, model) -> deque of durations
+        self._server = None
+
+    def span(self, name, **attrs):
+        """Start a span; attrs are written to the trace and 'model' is a metric label"""
+        return Span(self, name, attrs)
+
+    def record(self, span):
+        """Aggregate a finished span and append it to the trace log"""
+        model = span.attrs.get("model") or ""
+        key = (span.name, model)
+        with self._lock:
+            self._spans.setdefault(key, _Histogram()).observe(span.duration)
+            self._recent.setdefault(key, deque(maxlen=QUANTILE_WINDOW)).append(span.duration)
+            for phase, seconds in span.phases.items():
+                self._phases.setdefault((span.name, phase, model), _Histogram()).observe(seconds)
+            if not span.ok:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            if span.tokens:
+                for kind, count in span.tokens.items():
+                    self._tokens[(model, kind)] = self._tokens.get((model, kind), 0) + count
+            if self.trace_path:
+                self._write_trace(span)
+
+    def _write_trace(self, span):
+        entry = {
+            "ts": span.started_at,
+            "span": span.name,
+            "duration": round(span.duration, 6),
+            "ok": span.ok,
+            **span.attrs,
+            "phases": {name: round(seconds, 6) for name, seconds in span.phases.items()}
+        }
+        if span.tokens:
+            entry["tokens"] = span.tokens
+        if span.error:
+            entry["error"] = span.error
+        try:
+            if self._trace_file is None:
+                # Line-buffered append; each span is one short write, so processes can share the file
+                self._trace_file = open(self.trace_path, "a", buffering=1)
+            self._trace_file.write(json.dumps(entry, default=str) + "\n")
+        except OSError:
+            pass
+
+    def quantiles(self, name, fractions=(0.5, 0.95)):
+        """{model: {"count": n, "p50": s, "p95": s}} over the recent window of a span"""
+        with self._lock:
+            windows = {model: sorted(values) for (span, model), values in self._recent.items() if span == name}
+        return {
+            model: dict(
+                {"count": len(values)},
+                **{f"p{int(fraction * 100)}": percentile(values, fraction) for fraction in fractions}
+            )
+            for model, values in windows.items()
+        }
+
+    def prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP chat_span_seconds Duration of instrumented operations")
+            lines.append("# TYPE chat_span_seconds histogram")
+            for (name, model), histogram in sorted(self._spans.items()):
+                lines.extend(_histogram_lines("chat_span_seconds", {"span": name, "model": model}, histogram))
+            lines.append("# HELP chat_phase_seconds Duration of phases within an operation")
+            lines.append("# TYPE chat_phase_seconds histogram")
+            for (name, phase, model), histogram in sorted(self._phases.items()):
+                labels = {"span": name, "phase": phase, "model": model}
+                lines.extend(_histogram_lines("chat_phase_seconds", labels, histogram))
+            lines.append("# HELP chat_span_errors_total Failed instrumented operations")
+            lines.append("# TYPE chat_span_errors_total counter")
+            for (name, model), count in sorted(self._errors.items()):
+                lines.append(f"chat_span_errors_total{_labels({'span': name, 'model': model})} {count}")
+            lines.append("# HELP chat_tokens_total Tokens reported by the API")
+            lines.append("# TYPE chat_tokens_total counter")
+            for (model, kind), count in sorted(self._tokens.items()):
+                lines.append(f"chat_tokens_total{_labels({'model': model, 'kind': kind})} {count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT):
+        """Serve /metrics on a daemon thread (idempotent; port 0 disables it)"""
+        if not port or self._server is not None:
+            return
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        except OSError:
+            # Another server process on this host already exports metrics on the port
+            return
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+
+
+def _labels(labels):
+    """Format a Prometheus label set, escaping backslashes, quotes and newlines"""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _histogram_lines(metric, labels, histogram):
+    lines = []
+    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+        lines.append(f"{metric}_bucket{_labels(dict(labels, le=repr(bound)))} {count}")
+    lines.append(f"{metric}_bucket{_labels(dict(labels, le='+Inf'))} {histogram.count}")
+    lines.append(f"{metric}_sum{_labels(labels)} {histogram.total}")
+    lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+def get_telemetry():
+    """Process-wide Telemetry instance"""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry()
+                _telemetry.serve()
+    return _telemetry
+
+
+def traced(name):
+    """Decorator recording a span around each call of a function"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_telemetry().span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
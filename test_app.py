@@ -257,12 +257,26 @@ class TestRunner:
                 self.failure(f"Invalid guest ID format: {guest_id}")
             
             # Test password hashing
+            from passwords import verify_password, needs_rehash
             password = "test123"
             hashed = app.hash_password(password)
-            if len(hashed) == 64:  # SHA256 produces 64 character hex string
+            if hashed.startswith("scrypt$") and hashed != app.hash_password(password):  # Salted scrypt
                 self.success("Password hashing works")
             else:
                 self.failure("Password hashing failed")
+            
+            if verify_password(password, hashed) and not verify_password("wrong", hashed):
+                self.success("Password verification works")
+            else:
+                self.failure("Password verification failed")
+            
+            # Legacy SHA-256 hashes still verify and are flagged for upgrade
+            import hashlib
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            if verify_password(password, legacy) and needs_rehash(legacy) and not needs_rehash(hashed):
+                self.success("Legacy hashes verify and are marked for upgrade")
+            else:
+                self.failure("Legacy hash handling failed")
                 
             # Test user registration (with temporary file)
             test_email = "test@example.com"
@@ -282,6 +296,486 @@ class TestRunner:
         except Exception as e:
             self.failure(f"Authentication test error: {str(e)}")
 
+    def test_history_store(self):
+        """Test chat history store, user repository and users.json migration"""
+        self.log(f"\n{Colors.BOLD}📜 Testing Chat History Store{Colors.END}")
+        
+        try:
+            from chat_store import HistoryStore, UserRepository
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                users_path = os.path.join(tmp_dir, "users.json")
+                with open(users_path, "w") as f:
+                    json.dump({
+                        "old@example.com": {
+                            "password": "",
+                            "chat_history": [
+                                {"timestamp": "2024-01-01T00:00:00", "prompt": "hi", "response": "hello", "model": "m"}
+                            ]
+                        }
+                    }, f)
+                
+                store = HistoryStore(os.path.join(tmp_dir, "history.db"))
+                
+                # Migration imports legacy history exactly once
+                migrated = store.migrate_from_users_json(users_path)
+                store.migrate_from_users_json(users_path)
+                if migrated == 1 and len(store.recent("old@example.com")) == 1:
+                    self.success("Legacy users.json history migrated")
+                else:
+                    self.failure(f"History migration failed: {migrated} entries")
+                
+                with open(users_path, "r") as f:
+                    if "chat_history" not in json.load(f)["old@example.com"]:
+                        self.success("users.json stripped of chat history")
+                    else:
+                        self.failure("users.json still contains chat history")
+                
+                # Appends are returned oldest first, limited to the newest entries
+                for i in range(5):
+                    store.append("new@example.com", f"prompt {i}", f"response {i}", "m")
+                recent = store.recent("new@example.com", limit=3)
+                if [entry["prompt"] for entry in recent] == ["prompt 2", "prompt 3", "prompt 4"]:
+                    self.success("History append and recent lookup work")
+                else:
+                    self.failure(f"Unexpected recent history: {recent}")
+                
+                # Cursor pagination walks from newest to oldest without overlap
+                first_page, cursor = store.page("new@example.com", page_size=3)
+                second_page, last_cursor = store.page("new@example.com", before=cursor, page_size=3)
+                prompts = [entry["prompt"] for entry in first_page + second_page]
+                if prompts == [f"prompt {i}" for i in range(4, -1, -1)] and last_cursor is None:
+                    self.success("History pagination works")
+                else:
+                    self.failure(f"Unexpected history pages: {prompts}")
+                
+                # Accounts are imported once and read by key
+                repository = UserRepository(store)
+                repository.migrate_from_users_json(users_path)
+                if repository.exists("old@example.com") and repository.get("missing@example.com") is None:
+                    self.success("User repository keyed lookup works")
+                else:
+                    self.failure("User repository lookup failed")
+                
+                repository.add("guest", {"password": "", "is_guest": True, "guest_session_id": "s1"})
+                if not repository.add("old@example.com", {"password": "x"}) and repository.guests() == {"guest": "s1"}:
+                    self.success("Duplicate accounts rejected and guests indexed")
+                else:
+                    self.failure("User repository add/guests failed")
+                repository.close()
+                store.close()
+                
+        except Exception as e:
+            self.failure(f"History store test error: {str(e)}")
+
+    def test_context_window(self):
+        """Test token-budgeted context trimming"""
+        self.log(f"\n{Colors.BOLD}✂️  Testing Context Window{Colors.END}")
+        
+        try:
+            from context_window import build_context, estimate_tokens, RESPONSE_RESERVE_TOKENS
+            
+            system_prompt = {"role": "system", "content": "Be helpful."}
+            history = []
+            for i in range(20):
+                history.append({"role": "user", "content": f"question {i} " + "x" * 400})
+                history.append({"role": "assistant", "content": f"answer {i} " + "y" * 400})
+            history.append({"role": "user", "content": "latest question"})
+            
+            # Estimates are cached on the message dict
+            estimate_tokens(history[0])
+            if "tokens" in history[0]:
+                self.success("Token estimates are cached on messages")
+            else:
+                self.failure("Token estimate was not cached")
+            
+            messages, report = build_context(system_prompt, history, RESPONSE_RESERVE_TOKENS + 1000)
+            if messages[-1]["content"] == "latest question" and report["trimmed_messages"] > 0:
+                self.success(f"Context trimmed to budget ({report['trimmed_messages']} messages dropped)")
+            else:
+                self.failure(f"Context was not trimmed: {report}")
+            
+            if report["prompt_tokens"] <= report["budget"] and messages[1]["role"] == "user":
+                self.success("Kept turns fit the budget and start with a user message")
+            else:
+                self.failure(f"Context window exceeds budget: {report}")
+            
+            if all(set(message) == {"role", "content"} for message in messages):
+                self.success("API messages contain only role and content")
+            else:
+                self.failure("API messages leak bookkeeping keys")
+                
+        except Exception as e:
+            self.failure(f"Context window test error: {str(e)}")
+
+    def test_response_cache(self):
+        """Test response cache keying, LRU/size eviction, TTL and persistence"""
+        self.log(f"\n{Colors.BOLD}⚡ Testing Response Cache{Colors.END}")
+        
+        try:
+            from response_cache import ResponseCache, cache_key
+            
+            messages = [{"role": "user", "content": "Hello   world "}]
+            if cache_key("m", messages, 0.7) == cache_key("m", [{"role": "user", "content": "Hello world"}], 0.7):
+                self.success("Cache keys ignore whitespace differences")
+            else:
+                self.failure("Normalized conversations produce different keys")
+            if cache_key("m", messages, 0.7) != cache_key("other", messages, 0.7):
+                self.success("Cache keys include the model")
+            else:
+                self.failure("Different models share a cache key")
+            
+            cache = ResponseCache(max_bytes=10, ttl=60, path="")
+            cache.put("a", "12345")
+            cache.put("b", "12345")
+            cache.get("a")
+            cache.put("c", "12345")
+            if cache.get("a") == "12345" and cache.get("b") is None:
+                self.success("Least recently used entry evicted past the size cap")
+            else:
+                self.failure(f"Unexpected eviction: {cache.stats()}")
+            
+            expired = ResponseCache(max_bytes=100, ttl=0.01, path="")
+            expired.put("a", "value")
+            time.sleep(0.02)
+            if expired.get("a") is None:
+                self.success("Expired entries are not served")
+            else:
+                self.failure("Expired entry was served")
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "cache.db")
+                ResponseCache(max_bytes=100, ttl=60, path=path).put("k", "persisted")
+                if ResponseCache(max_bytes=100, ttl=60, path=path).get("k") == "persisted":
+                    self.success("Cache entries persist to disk")
+                else:
+                    self.failure("Persisted cache entry was not reloaded")
+                    
+        except Exception as e:
+            self.failure(f"Response cache test error: {str(e)}")
+
+    def test_guest_sessions(self):
+        """Test in-memory guest sessions, TTL expiry and promotion"""
+        self.log(f"\n{Colors.BOLD}👤 Testing Guest Sessions{Colors.END}")
+        
+        try:
+            from guest_sessions import GuestSessionStore
+            from chat_store import HistoryStore
+            
+            guests = GuestSessionStore(ttl=60)
+            guest_id = guests.create("session-1")
+            guests.append(guest_id, "hi", "hello", "m")
+            if guest_id.startswith("Guest_") and guests.recent(guest_id)[0]["prompt"] == "hi":
+                self.success("Guest history kept in memory")
+            else:
+                self.failure("Guest session history missing")
+            
+            if guests.reap(now=time.time() + 120) == (1, 1) and guest_id not in guests:
+                self.success("Idle guest sessions expire after the TTL")
+            else:
+                self.failure("Idle guest session was not expired")
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                store = HistoryStore(os.path.join(tmp_dir, "history.db"))
+                guest_id = guests.create("session-2")
+                guests.append(guest_id, "keep me", "ok", "m")
+                guests.promote(guest_id, "user@example.com", store)
+                if store.recent("user@example.com")[0]["prompt"] == "keep me" and guest_id not in guests:
+                    self.success("Guest history promoted to durable storage on sign-in")
+                else:
+                    self.failure("Guest promotion failed")
+                store.close()
+                
+        except Exception as e:
+            self.failure(f"Guest session test error: {str(e)}")
+
+    def test_chat_service(self):
+        """Test the headless chat service: lazy start-up, accounts and history"""
+        self.log(f"\n{Colors.BOLD}🧩 Testing Chat Service{Colors.END}")
+        
+        try:
+            from chat_service import ChatService
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                service = ChatService(
+                    history_path=os.path.join(tmp_dir, "history.db"),
+                    users_json_path=os.path.join(tmp_dir, "users.json")
+                )
+                if not service._components and not os.listdir(tmp_dir):
+                    self.success("Service construction creates no clients or files")
+                else:
+                    self.failure("Service created components before first use")
+                
+                guest_id = service.start_guest("session-1")
+                service.save_prompt(guest_id, "as a guest", "ok", "m")
+                registered, _ = service.register("svc@example.com", "secret123")
+                signed_in, _ = service.sign_in("svc@example.com", "secret123", guest_id=guest_id)
+                history = service.history("svc@example.com")
+                if registered and signed_in and [e["prompt"] for e in history] == ["as a guest"] \
+                        and not service.is_guest(guest_id):
+                    self.success("Sign-in carries guest history over to the account")
+                else:
+                    self.failure(f"Unexpected history after sign-in: {history}")
+                
+                if "engine" not in service._components and "health_monitor" not in service._components:
+                    self.success("Account and history calls leave the API client unstarted")
+                else:
+                    self.failure("API client started without a chat or model call")
+                service.close()
+                
+        except Exception as e:
+            self.failure(f"Chat service test error: {str(e)}")
+
+    def test_api_server(self):
+        """Test the HTTP API against the mock Groq server"""
+        self.log(f"\n{Colors.BOLD}🌐 Testing HTTP API{Colors.END}")
+        
+        try:
+            from starlette.testclient import TestClient
+            from api_server import create_app
+            from chat_service import ChatService
+            from mock_groq import MockGroqServer
+            
+            server = MockGroqServer(latency=0.01, token_delay=0.001, reply_tokens=8).start()
+            try:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    service = ChatService(
+                        api_key="gsk_test",
+                        history_path=os.path.join(tmp_dir, "history.db"),
+                        users_json_path=os.path.join(tmp_dir, "users.json"),
+                        catalog_path=os.path.join(tmp_dir, "catalog.json"),
+                        base_url=server.base_url
+                    )
+                    with TestClient(create_app(service)) as client:
+                        credentials = {"email": "api@example.com", "password": "secret123"}
+                        registered = client.post("/auth/register", json=credentials).status_code
+                        duplicate = client.post("/auth/register", json=credentials).status_code
+                        rejected = client.post("/auth/login", json={**credentials, "password": "wrong"}).status_code
+                        token = client.post("/auth/login", json=credentials).json().get("token")
+                        if (registered, duplicate, rejected) == (201, 409, 401) and token:
+                            self.success("Register and login issue a bearer token")
+                        else:
+                            self.failure(f"Unexpected auth statuses: {registered}, {duplicate}, {rejected}")
+                        
+                        headers = {"Authorization": f"Bearer {token}"}
+                        request = {"prompt": "Stream over HTTP", "model": "llama-3.1-8b-instant"}
+                        with client.stream("POST", "/chat", json=request, headers=headers) as response:
+                            body = "".join(response.iter_text())
+                        done = json.loads(body.strip().splitlines()[-1].partition("data: ")[2])
+                        if "event: delta" in body and "event: done" in body and done.get("usage"):
+                            self.success("Chat streams deltas then a done event with usage")
+                        else:
+                            self.failure(f"Unexpected SSE body: {body[:200]!r}")
+                        
+                        history = client.get("/history", headers=headers).json()
+                        anonymous = client.get("/history").status_code
+                        if [e["prompt"] for e in history["entries"]] == ["Stream over HTTP"] and anonymous == 401:
+                            self.success("Signed-in turns saved; history requires a token")
+                        else:
+                            self.failure(f"Unexpected history: {history}, anonymous status {anonymous}")
+                        
+                        if client.post("/chat", json={"prompt": "", "model": "x"}).status_code == 400:
+                            self.success("Invalid chat requests rejected")
+                        else:
+                            self.failure("Empty prompt was accepted")
+            finally:
+                server.stop()
+        
+        except Exception as e:
+            self.failure(f"API server test error: {str(e)}")
+
+    def test_batch_runner(self):
+        """Test batch prompt processing and resuming from the output file"""
+        self.log(f"\n{Colors.BOLD}📦 Testing Batch Runner{Colors.END}")
+        
+        try:
+            import asyncio
+            from batch_runner import ResultWriter, load_checkpoint, read_rows, run_batch
+            from chat_service import ChatService
+            from mock_groq import MockGroqServer
+            
+            server = MockGroqServer(latency=0.01, token_delay=0.001, reply_tokens=8).start()
+            try:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    input_path = os.path.join(tmp_dir, "prompts.jsonl")
+                    output_path = os.path.join(tmp_dir, "results.jsonl")
+                    with open(input_path, "w") as f:
+                        for i in range(3):
+                            f.write(json.dumps({"id": f"q{i}", "prompt": f"Batch question {i}"}) + "\n")
+                        f.write("not json\n")
+                    service = ChatService(
+                        api_key="gsk_test",
+                        history_path=os.path.join(tmp_dir, "history.db"),
+                        users_json_path=os.path.join(tmp_dir, "users.json"),
+                        catalog_path=os.path.join(tmp_dir, "catalog.json"),
+                        base_url=server.base_url
+                    )
+                    
+                    def run(rows):
+                        writer = ResultWriter(output_path)
+                        try:
+                            return asyncio.run(run_batch(
+                                service, rows, ["llama-3.1-8b-instant"], writer, load_checkpoint(output_path),
+                                concurrency=2, quiet=True
+                            ))
+                        finally:
+                            writer.close()
+                    
+                    # First run stops after two rows, as if the process had been killed
+                    rows = read_rows(input_path)
+                    first = run(next(rows) for _ in range(2))
+                    second = run(read_rows(input_path))
+                    with open(output_path) as f:
+                        records = [json.loads(line) for line in f]
+                    if (first["ok"], second["ok"], second["skipped"], second["invalid"]) == (2, 1, 2, 1) \
+                            and sorted(r["id"] for r in records) == ["q0", "q1", "q2"]:
+                        self.success("Resumed batch answers only the unfinished rows")
+                    else:
+                        self.failure(f"Unexpected batch runs: {first}, {second}")
+                    
+                    if all(r["usage"] and r["latency"] > 0 and r["content"] for r in records):
+                        self.success("Each result row records content, latency and usage")
+                    else:
+                        self.failure(f"Incomplete result rows: {records}")
+                    service.close()
+            finally:
+                server.stop()
+        
+        except Exception as e:
+            self.failure(f"Batch runner test error: {str(e)}")
+
+    def test_rendering(self):
+        """Test assistant output rendering"""
+        self.log(f"\n{Colors.BOLD}🧠 Testing Output Rendering{Colors.END}")
+        
+        try:
+            from rendering import render_assistant_output
+            
+            rendered = render_assistant_output("<think>plan</think>Answer <b>x</b>")
+            if "<details>" in rendered and "plan" in rendered and "&lt;b>x" in rendered:
+                self.success("Thinking blocks collapsible and HTML escaped")
+            else:
+                self.failure(f"Unexpected rendering: {rendered!r}")
+            
+            code = "```html\n<think>not a tag</think>\n```"
+            if render_assistant_output(code) == code:
+                self.success("Code fences left untouched")
+            else:
+                self.failure("Code fence content was modified")
+            
+            partial = render_assistant_output("<think>still going", streaming=True)
+            if "Model is thinking" in partial and render_assistant_output("Hello <thi", streaming=True) == "Hello ":
+                self.success("Partial streaming buffers rendered")
+            else:
+                self.failure("Partial streaming buffer rendered incorrectly")
+                
+        except Exception as e:
+            self.failure(f"Rendering test error: {str(e)}")
+
+    def test_model_catalog(self):
+        """Test model catalog filtering and metadata"""
+        self.log(f"\n{Colors.BOLD}📚 Testing Model Catalog{Colors.END}")
+        
+        try:
+            from model_catalog import CatalogStore, ModelCatalog
+            
+            catalog = ModelCatalog.from_response({"data": [
+                {"id": "qwen-qwq", "context_window": 32768, "owned_by": "Alibaba", "active": True},
+                {"id": "llama-3.1-8b-instant", "context_window": 131072, "active": True},
+                {"id": "whisper-large-v3", "active": True},
+                {"id": "playai-tts", "active": True},
+                {"id": "llama-retired", "active": False}
+            ]})
+            if catalog.ids == ["llama-3.1-8b-instant", "qwen-qwq"] and catalog.index_of("qwen-qwq") == 1:
+                self.success("Catalog filtered and sorted once")
+            else:
+                self.failure(f"Unexpected catalog models: {catalog.ids}")
+            
+            if catalog.context_window("qwen-qwq") == 32768 and catalog.models["qwen-qwq"]["owned_by"] == "Alibaba":
+                self.success("Model metadata kept in the catalog")
+            else:
+                self.failure("Model metadata missing from the catalog")
+            
+            llama_only = ModelCatalog.from_names({"llama-3.1-8b-instant": "", "gemma2-9b-it": ""}, include="llama*", exclude="")
+            if llama_only.ids == ["llama-3.1-8b-instant"]:
+                self.success("Include rules applied")
+            else:
+                self.failure(f"Include rules not applied: {llama_only.ids}")
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "model_catalog.json")
+                store = CatalogStore({"fallback-model": "Fallback"}, path=path)
+                store.update({"data": [{"id": "qwen-qwq", "context_window": 32768}]})
+                restarted = CatalogStore({"fallback-model": "Fallback"}, path=path)
+                if store.source == "live" and restarted.source == "disk" and restarted.current().ids == ["qwen-qwq"]:
+                    self.success("Last good model list persisted for cold starts")
+                else:
+                    self.failure(f"Catalog persistence failed: {restarted.status()}")
+                
+        except Exception as e:
+            self.failure(f"Model catalog test error: {str(e)}")
+
+    def test_telemetry(self):
+        """Test timing spans, token counts and metric export"""
+        self.log(f"\n{Colors.BOLD}📈 Testing Telemetry{Colors.END}")
+        
+        try:
+            from telemetry import Telemetry
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                trace_path = os.path.join(tmp_dir, "trace.jsonl")
+                telemetry = Telemetry(trace_path=trace_path)
+                for _ in range(3):
+                    with telemetry.span("chat.turn", model="m") as span:
+                        span.phase("api", 0.01)
+                        span.usage({"prompt_tokens": 10, "completion_tokens": 5})
+                
+                metrics = telemetry.prometheus()
+                if 'chat_span_seconds_count{span="chat.turn",model="m"} 3' in metrics and \
+                        'chat_tokens_total{model="m",kind="completion"} 15' in metrics:
+                    self.success("Spans exported as Prometheus metrics")
+                else:
+                    self.failure("Prometheus metrics missing span or token counts")
+                
+                with open(trace_path) as f:
+                    traces = [json.loads(line) for line in f]
+                if len(traces) == 3 and traces[0]["phases"]["api"] == 0.01 and telemetry.quantiles("chat.turn")["m"]["count"] == 3:
+                    self.success("Trace log and percentiles recorded")
+                else:
+                    self.failure("Trace log or percentiles incomplete")
+                    
+        except Exception as e:
+            self.failure(f"Telemetry test error: {str(e)}")
+
+    def test_storage_benchmark(self):
+        """Test the storage benchmark on a tiny synthetic dataset"""
+        self.log(f"\n{Colors.BOLD}⏱️ Testing Storage Benchmark{Colors.END}")
+        
+        try:
+            from storage_benchmark import run_case, compare
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                case = run_case(50, 2, tmp_dir, samples=5, auth_samples=1, guest_fraction=0.2)
+            
+            operations = case["operations"]
+            expected = {"import_users_json", "load_user_data", "authenticate_user",
+                        "get_user_history", "save_user_prompt", "cleanup_guest_users"}
+            if expected <= set(operations) and all(op["calls"] and op["peak_rss"] for op in operations.values()):
+                self.success("Every storage operation timed with peak RSS")
+            else:
+                self.failure(f"Benchmark operations incomplete: {sorted(operations)}")
+            
+            slower = json.loads(json.dumps({"cases": [case]}))
+            slower["cases"][0]["operations"]["load_user_data"]["p50"] *= 10
+            regressions = compare(slower, {"cases": [case]})
+            if [r["operation"] for r in regressions] == ["load_user_data"]:
+                self.success("Baseline comparison flags a slowed operation")
+            else:
+                self.failure(f"Unexpected regressions: {regressions}")
+                
+        except Exception as e:
+            self.failure(f"Storage benchmark test error: {str(e)}")
+
     def test_model_loading(self):
         """Test model loading functionality"""
         self.log(f"\n{Colors.BOLD}🤖 Testing Model Loading{Colors.END}")
@@ -373,6 +867,17 @@ class TestRunner:
         self.test_groq_api_connection()
         self.test_app_imports()
         self.test_authentication_functions()
+        self.test_history_store()
+        self.test_context_window()
+        self.test_response_cache()
+        self.test_guest_sessions()
+        self.test_chat_service()
+        self.test_api_server()
+        self.test_batch_runner()
+        self.test_rendering()
+        self.test_model_catalog()
+        self.test_telemetry()
+        self.test_storage_benchmark()
         self.test_model_loading()
         self.test_docker_setup()
         